@@ -1,13 +1,14 @@
 import os
-import json
 import logging
-import asyncio
-from typing import Optional, AsyncGenerator, Dict, Any
+from contextlib import asynccontextmanager
+from typing import Optional, AsyncGenerator, AsyncIterator, Dict, Any, Union, Annotated, Mapping, Tuple
 from fastapi import FastAPI, Request, Response, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
 import uvicorn
-import aiohttp
+import httpx
+import msgspec
+import orjson
 from dotenv import load_dotenv
 
 
@@ -21,6 +22,32 @@ logging.basicConfig(
     force=True  # 强制重新配置，覆盖现有配置
 )
 logger = logging.getLogger(__name__)
+# httpx 默认会为每个上游请求输出一条 INFO 日志，这里只保留警告及以上
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# 转发前从客户端请求中移除的采样参数
+_STRIP_FIELDS = ("top_p", "temperature")
+
+
+class Message(msgspec.Struct):
+    """请求中单条消息的格式约束（只校验，不用于转发）"""
+    role: str
+    content: Any
+
+
+class MessagesRequest(msgspec.Struct):
+    """/v1/messages 请求的格式约束，未声明的字段会被忽略"""
+    model: str
+    messages: Annotated[list[Message], msgspec.Meta(min_length=1)]
+
+
+class UpstreamHTTPError(Exception):
+    """上游返回 HTTP 错误状态，携带上游状态码和（已包装为标准格式的）错误响应体"""
+
+    def __init__(self, status_code: int, body: Dict[str, Any]):
+        super().__init__(f"Anthropic API returned status {status_code}")
+        self.status_code = status_code
+        self.body = body
 
 
 class AnthropicRequestHandler:
@@ -30,7 +57,23 @@ class AnthropicRequestHandler:
         self.api_url = api_url.rstrip('/')
         self.api_key = api_key
         self.cache_control_ttl = cache_control_ttl
-        self.session: Optional[aiohttp.ClientSession] = None
+        self.client: Optional[httpx.AsyncClient] = None
+
+        # 固定的上游请求头模板，每个请求只需复制后覆盖少量可选头部
+        self._header_template = {
+            'x-api-key': api_key,
+            'anthropic-version': '2023-06-01',
+            'content-type': 'application/json',
+        }
+
+        # 所有请求共用同一个 cache_control 字典（只读，从不修改）
+        self._cc = {"type": "ephemeral", "ttl": cache_control_ttl}
+        self._cc_text_block_template = {"type": "text", "text": "", "cache_control": self._cc}
+
+        # 固定内容的 SSE 错误帧在初始化时预先编码
+        self._timeout_error_frame = self._sse_error_frame(
+            "timeout_error", "Request to Anthropic API timed out"
+        )
 
         # 检查API URL是否已经包含完整路径
         if self.api_url.endswith('/v1/messages'):
@@ -40,138 +83,191 @@ class AnthropicRequestHandler:
 
         logger.info(f"Initialized with cache_control TTL: {cache_control_ttl}")
 
-    async def _get_session(self) -> aiohttp.ClientSession:
-        """获取或创建 aiohttp 会话"""
-        if self.session is None or self.session.closed:
+    @staticmethod
+    def _upstream_error(response: httpx.Response) -> UpstreamHTTPError:
+        """根据上游错误响应构建 UpstreamHTTPError
+
+        上游错误体为 {"error": {...}} 格式时原样保留，其他内容（非 JSON、非字典、
+        缺少 error 字段）统一包装为 {"type": "error", "error": {...}}。
+        """
+        body = None
+        if response.headers.get('content-type', '').startswith('application/json'):
+            try:
+                body = orjson.loads(response.content)
+            except orjson.JSONDecodeError:
+                pass
+        if not (isinstance(body, dict) and isinstance(body.get('error'), dict)):
+            body = {
+                "type": "error",
+                "error": {
+                    "type": "api_error",
+                    "message": f"Anthropic API returned status {response.status_code}"
+                }
+            }
+        return UpstreamHTTPError(response.status_code, body)
+
+    @staticmethod
+    def _sse_error_frame(error_type: str, message: str) -> bytes:
+        """构建 SSE 格式的错误帧"""
+        return b'event: error\ndata: ' + orjson.dumps(
+            {"error": {"type": error_type, "message": message}}
+        ) + b'\n\n'
+
+    async def init_client(self) -> None:
+        """创建 httpx 客户端，应用启动时调用一次，之后所有请求复用同一连接池
+
+        启用 HTTP/2，所有并发请求在少量 TLS 连接上多路复用，
+        不再需要为每个并发请求单独占用一个 TCP 连接。
+        """
+        self.client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=None,  # 不限制连接数，只有一个上游主机
+                max_keepalive_connections=50,
+                # 空闲连接保持时间低于上游的空闲超时（约60秒），避免复用已被上游关闭的连接
+                keepalive_expiry=45,
+            ),
             # 优化超时配置以支持长上下文和并发
-            timeout = aiohttp.ClientTimeout(
-                total=300,  # 总超时增加到5分钟
-                connect=60,  # 连接超时1分钟
-                sock_read=240  # 读取超时4分钟
-            )
-            self.session = aiohttp.ClientSession(
-                timeout=timeout,
-                connector=aiohttp.TCPConnector(
-                    limit=50,  # 减少总连接池大小避免资源竞争
-                    limit_per_host=10,  # 减少每个主机的连接数
-                    ttl_dns_cache=300,
-                    use_dns_cache=True,
-                    # 启用keep-alive连接
-                    keepalive_timeout=30,
-                    # 启用TCP缓冲区自动调整
-                    enable_cleanup_closed=True,
-                )
-            )
-        return self.session
+            timeout=httpx.Timeout(
+                300.0,  # 写入和连接池等待超时5分钟
+                connect=60.0,  # 连接超时1分钟
+                read=240.0  # 读取超时4分钟
+            ),
+        )
 
-    def _prepare_headers(self, original_headers: Dict[str, str]) -> Dict[str, str]:
-        """准备请求头，使用配置中的默认API Key，不转发客户端头部"""
-        headers = {}
+        await self._warm_up_connection()
 
-        # 只添加必要的头部，不转发客户端的敏感头部
-        headers['x-api-key'] = self.api_key
-        headers['anthropic-version'] = original_headers.get('anthropic-version', '2023-06-01')
-        headers['content-type'] = 'application/json'
+    async def _warm_up_connection(self) -> None:
+        """预热连接池，让第一个真实请求可以直接复用已建立的连接"""
+        try:
+            await self.client.get(self.api_url)
+            logger.info("Upstream connection pool warmed up")
+        except httpx.HTTPError as e:
+            logger.warning(f"Failed to warm up upstream connection: {str(e)}")
+
+    @asynccontextmanager
+    async def _post_stream(self, url: str, content: bytes,
+                           headers: Dict[str, str]) -> AsyncIterator[httpx.Response]:
+        """以流模式发送 POST 请求，退出时关闭响应
+
+        如果复用的空闲连接已被上游关闭，在收到任何响应之前会断开，
+        此时请求尚未被处理，换一个新连接重试一次。
+        """
+        request = self.client.build_request('POST', url, content=content, headers=headers)
+        try:
+            response = await self.client.send(request, stream=True)
+        except httpx.RemoteProtocolError as e:
+            logger.warning(f"Upstream closed the connection before responding, retrying once: {str(e)}")
+            response = await self.client.send(request, stream=True)
 
-        # 保留一些可能需要的客户端头部（可选）
-        optional_headers = ['anthropic-beta', 'user-agent']
-        for header in optional_headers:
-            if header in original_headers:
-                headers[header] = original_headers[header]
+        try:
+            yield response
+        finally:
+            await response.aclose()
+
+    def _prepare_headers(self, original_headers: Mapping[str, str]) -> Dict[str, str]:
+        """准备请求头，使用配置中的默认API Key，不转发客户端头部"""
+        headers = self._header_template.copy()
+
+        # 只保留少量可能需要的客户端头部，不转发客户端的敏感头部
+        anthropic_version = original_headers.get('anthropic-version')
+        if anthropic_version:
+            headers['anthropic-version'] = anthropic_version
+        anthropic_beta = original_headers.get('anthropic-beta')
+        if anthropic_beta:
+            headers['anthropic-beta'] = anthropic_beta
+        user_agent = original_headers.get('user-agent')
+        if user_agent:
+            headers['user-agent'] = user_agent
 
         return headers
 
-    def _remove_cache_control_recursive(self, data) -> None:
-        """递归地从数据结构中移除所有 cache_control 字段
+    def _negotiate_encoding(self, original_headers: Mapping[str, str]) -> str:
+        """根据客户端的 Accept-Encoding 选择上游压缩方式
+
+        只请求客户端也能解码的压缩格式，这样上游的压缩响应可以原样转发，
+        代理不需要解压再压缩。客户端都不支持时使用 identity。
+        只协商 gzip：错误响应需要由代理解码解析，而 httpx 未安装 brotli 时无法解码 br。
+        """
+        accepted = set()
+        for part in original_headers.get('accept-encoding', '').split(','):
+            coding, _, params = part.strip().partition(';')
+            if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                continue
+            accepted.add(coding.strip().lower())
+
+        return 'gzip' if 'gzip' in accepted else 'identity'
 
-        处理的数据结构类型：
-        - dict: 移除 cache_control 键，并递归处理所有值
-        - list: 递归处理所有元素
-        - 其他: 忽略
+    def _strip_cache_control(self, blocks: list) -> int:
+        """移除块列表中所有 cache_control 字段（in-place），返回移除的数量
 
-        注意：此函数直接修改传入的数据（in-place）
+        块可以是 system / messages 的 content 块、tools 定义或消息本身；
+        如果块带有嵌套的 content 列表（如消息、tool_result），一并处理。
         """
-        if isinstance(data, dict):
-            # 移除当前字典级别的 cache_control
-            if 'cache_control' in data:
-                del data['cache_control']
-            # 递归处理所有值
-            for value in data.values():
-                self._remove_cache_control_recursive(value)
-        elif isinstance(data, list):
-            # 递归处理列表中的每个元素
-            for item in data:
-                self._remove_cache_control_recursive(item)
-        # 其他类型（str, int, bool, None等）忽略
-
-    def _standardize_cache_control(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
+        removed = 0
+        for block in blocks:
+            if isinstance(block, dict):
+                if block.pop('cache_control', None) is not None:
+                    removed += 1
+                nested = block.get('content')
+                if isinstance(nested, list):
+                    removed += self._strip_cache_control(nested)
+        return removed
+
+    def _standardize_cache_control(self, request_data: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
         """标准化请求中的 cache_control 策略
 
-        1. 递归清理所有位置的 cache_control（包括 system、messages 等）
+        1. 单次遍历清理 system、tools、messages 中的 cache_control
         2. 只在最后一条消息的最后添加标准的 cache_control
 
+        注意：直接修改传入的 request_data（in-place），不做拷贝
+
         Args:
             request_data: 完整的请求数据
 
         Returns:
-            处理后的请求数据
+            (处理后的请求数据（即传入的 request_data）, 内容是否发生了变化)
         """
-        logger.info(f"Original request keys: {request_data.keys()}")
-
-        # 创建请求的深拷贝，避免修改原始数据
-        standardized_request = request_data.copy()
-
-        # 第一步：递归删除所有位置的 cache_control
-        self._remove_cache_control_recursive(standardized_request)
+        # 如果客户端已经只在最后一个 content 块上带了标准 cache_control，
+        # 清理再添加后请求内容不变
+        messages = request_data.get('messages', [])
+        last_content = messages[-1].get('content') if messages else None
+        already_standard = (
+            isinstance(last_content, list) and bool(last_content)
+            and isinstance(last_content[-1], dict)
+            and last_content[-1].get('cache_control') == self._cc
+        )
+
+        # 第一步：原地删除 system、tools、messages 中的 cache_control
+        removed = 0
+        for key in ('system', 'tools', 'messages'):
+            blocks = request_data.get(key)
+            if isinstance(blocks, list):
+                removed += self._strip_cache_control(blocks)
+
+        changed = not (already_standard and removed == 1)
 
         # 第二步：在 messages 的最后一条消息添加 cache_control
-        messages = standardized_request.get('messages', [])
         if messages:
             last_message = messages[-1]
             content = last_message.get('content', [])
 
-            if isinstance(content, list):
-                # 在最后一个 content 块中添加 cache_control
-                if content:
-                    # 如果有 content 块，在最后一个块中添加 cache_control
-                    if isinstance(content[-1], dict):
-                        content[-1]['cache_control'] = {"type": "ephemeral", "ttl": self.cache_control_ttl}
-                    else:
-                        # 如果最后一个块不是 dict，创建新的 dict 块
-                        content.append({
-                            "type": "text",
-                            "text": str(content[-1]) if content[-1] else "",
-                            "cache_control": {"type": "ephemeral", "ttl": self.cache_control_ttl}
-                        })
+            if isinstance(content, list) and content:
+                if isinstance(content[-1], dict):
+                    # 在最后一个 content 块中添加 cache_control
+                    content[-1]['cache_control'] = self._cc
                 else:
-                    # 如果 content 为空，创建新的 content 块
-                    last_message['content'] = [{
-                        "type": "text",
-                        "text": "",
-                        "cache_control": {"type": "ephemeral", "ttl": self.cache_control_ttl}
-                    }]
+                    # 如果最后一个块不是 dict，创建新的 dict 块
+                    content.append({**self._cc_text_block_template, "text": str(content[-1]) if content[-1] else ""})
             elif isinstance(content, str):
                 # 将字符串转换为 list 格式并添加 cache_control
-                last_message['content'] = [
-                    {
-                        "type": "text",
-                        "text": content,
-                        "cache_control": {"type": "ephemeral", "ttl": self.cache_control_ttl}
-                    }
-                ]
+                last_message['content'] = [{**self._cc_text_block_template, "text": content}]
             else:
-                # 如果 content 为 None 或其他格式，创建新的 content
-                last_message['content'] = [
-                    {
-                        "type": "text",
-                        "text": "",
-                        "cache_control": {"type": "ephemeral", "ttl": self.cache_control_ttl}
-                    }
-                ]
-
-        logger.info(f"Standardized cache_control: cleared all cache_control, added TTL={self.cache_control_ttl} to last message")
-        logger.info(f"Standardized request keys: {standardized_request.keys()}")
-        return standardized_request
+                # 如果 content 为空、None 或其他格式，创建新的 content
+                last_message['content'] = [{**self._cc_text_block_template}]
+
+        logger.debug("Standardized cache_control: cleared all cache_control, added TTL=%s to last message", self.cache_control_ttl)
+        return request_data, changed
 
     def _has_cache_control(self, messages: list) -> bool:
         """检查消息是否包含缓存控制"""
@@ -191,72 +287,60 @@ class AnthropicRequestHandler:
                 pass
         return False
 
-    def _validate_anthropic_request(self, request_data: Dict[str, Any]) -> bool:
-        """验证Anthropic请求格式"""
-        required_fields = ['model', 'messages']
+    def _prepare_request(self, request_data: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """验证请求并标准化缓存策略，流式和非流式请求共用
 
-        for field in required_fields:
-            if field not in request_data:
-                logger.error(f"Missing required field: {field}")
-                return False
+        清理所有 cache_control（包括 system、messages 等），只在最后一条消息添加标准配置。
+        注意：直接修改传入的 request_data（in-place），调用方之后不应再使用原始数据。
 
-        messages = request_data.get('messages', [])
-        if not isinstance(messages, list) or len(messages) == 0:
-            logger.error("Messages must be a non-empty list")
-            return False
-
-        for message in messages:
-            if not isinstance(message, dict):
-                logger.error("Each message must be a dictionary")
-                return False
-            if 'role' not in message or 'content' not in message:
-                logger.error("Each message must have 'role' and 'content' fields")
-                return False
+        Returns:
+            (处理后的请求数据, 标准化是否改变了请求内容)
+        """
+        # 用 msgspec 在 C 层一次性校验请求结构，原始字典保持不变用于转发
+        try:
+            msgspec.convert(request_data, MessagesRequest)
+        except msgspec.ValidationError as e:
+            logger.error(f"Invalid request: {str(e)}")
+            raise ValueError(f"Invalid Anthropic request format: {str(e)}")
 
-        return True
+        return self._standardize_cache_control(request_data)
 
     async def handle_request(self, request_data: Dict[str, Any],
-                           headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
-        """处理Anthropic API请求"""
-        headers = headers or {}
-
-        # 验证请求格式
-        if not self._validate_anthropic_request(request_data):
-            raise ValueError("Invalid Anthropic request format")
+                           headers: Optional[Mapping[str, str]] = None,
+                           raw_body: Optional[bytes] = None) -> Union[Dict[str, Any], Response]:
+        """处理Anthropic API请求（会原地修改 request_data）
 
-        # 标准化缓存策略：清理所有 cache_control（包括 system、messages 等），
-        # 只在最后一条消息添加标准配置
-        standardized_request = self._standardize_cache_control(request_data)
+        raw_body 为客户端原始请求体；如果标准化没有改变请求内容，直接转发原始字节，不再重新编码。
+        """
+        standardized_request, changed = self._prepare_request(request_data)
 
         logger.info("Request processed with standardized cache_control strategy")
 
         # 直接转发请求给 Anthropic API
-        response_data = await self._forward_to_anthropic(standardized_request, headers)
-        return response_data
+        body = None if changed else raw_body
+        return await self._forward_to_anthropic(standardized_request, headers, body)
 
     async def handle_stream_request(self, request_data: Dict[str, Any],
-                                  headers: Optional[Dict[str, str]] = None) -> AsyncGenerator[bytes, None]:
-        """处理流式 Anthropic API 请求"""
-        headers = headers or {}
-
-        # 验证请求格式
-        if not self._validate_anthropic_request(request_data):
-            raise ValueError("Invalid Anthropic request format")
+                                  headers: Optional[Mapping[str, str]] = None,
+                                  raw_body: Optional[bytes] = None) -> AsyncGenerator[bytes, None]:
+        """处理流式 Anthropic API 请求（会原地修改 request_data）
 
-        # 标准化缓存策略：清理所有 cache_control（包括 system、messages 等），
-        # 只在最后一条消息添加标准配置
-        standardized_request = self._standardize_cache_control(request_data)
+        raw_body 的含义同 handle_request。
+        """
+        standardized_request, changed = self._prepare_request(request_data)
 
         logger.info("Stream request processed with standardized cache_control strategy")
 
         # 转发流式请求给 Anthropic API
-        async for chunk in self._forward_stream_to_anthropic(standardized_request, headers):
+        body = None if changed else raw_body
+        async for chunk in self._forward_stream_to_anthropic(standardized_request, headers, body):
             yield chunk
 
-    async def handle_get_request(self, endpoint: str, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
-        """处理GET请求（如models端点）"""
+    async def handle_get_request(self, endpoint: str, headers: Optional[Mapping[str, str]] = None) -> Dict[str, Any]:
+        """处理GET请求（如models端点），上游返回错误状态时抛出 UpstreamHTTPError"""
         prepared_headers = self._prepare_headers(headers or {})
-        session = await self._get_session()
+        # 响应体需要由代理解析，只接受 httpx 能解码的压缩格式
+        prepared_headers['accept-encoding'] = 'gzip'
 
         # 构建完整的URL
         if endpoint.startswith('/'):
@@ -267,13 +351,14 @@ class AnthropicRequestHandler:
         logger.info(f"Forwarding GET request to: {url}")
 
         try:
-            async with session.get(url, headers=prepared_headers) as response:
-                if response.headers.get('content-type', '').startswith('application/json'):
-                    return await response.json()
-                else:
-                    return {"data": await response.text()}
+            response = await self.client.get(url, headers=prepared_headers)
+            response.raise_for_status()
+            if response.headers.get('content-type', '').startswith('application/json'):
+                return orjson.loads(response.content)
+            else:
+                return {"data": response.text}
 
-        except asyncio.TimeoutError:
+        except httpx.TimeoutException:
             logger.error(f"Timeout error from Anthropic API: request timed out after 120 seconds")
             return {
                 "error": {
@@ -282,22 +367,12 @@ class AnthropicRequestHandler:
                 }
             }
 
-        except aiohttp.ClientResponseError as e:
-            logger.error(f"HTTP error from Anthropic API: {e.status} - {await e.text()}")
-            error_response = {
-                "error": {
-                    "type": "api_error",
-                    "message": f"Anthropic API returned status {e.status}"
-                }
-            }
-            if e.headers.get('content-type', '').startswith('application/json'):
-                try:
-                    error_response = await e.json()
-                except:
-                    pass
-            return error_response
+        except httpx.HTTPStatusError as e:
+            logger.error(f"HTTP error from Anthropic API: {e.response.status_code} - {e.response.text}")
+            # 上游状态码通过异常带出，由端点原样返回给客户端
+            raise self._upstream_error(e.response) from e
 
-        except aiohttp.ClientError as e:
+        except httpx.HTTPError as e:
             logger.error(f"Request error: {str(e)}")
             return {
                 "error": {
@@ -316,119 +391,100 @@ class AnthropicRequestHandler:
             }
 
     async def _forward_stream_to_anthropic(self, request_data: Dict[str, Any],
-                                      headers: Optional[Dict[str, str]] = None) -> AsyncGenerator[bytes, None]:
+                                      headers: Optional[Mapping[str, str]] = None,
+                                      body: Optional[bytes] = None) -> AsyncGenerator[bytes, None]:
         """转发流式请求到Anthropic API"""
         prepared_headers = self._prepare_headers(headers or {})
-        session = await self._get_session()
         url = self.messages_endpoint
 
         logger.info(f"Forwarding stream request to: {url}")
-        logger.info(f"Headers: {prepared_headers}")
-        logger.info(f"Request data: {request_data}")
-
+        logger.debug("Request data: %s", request_data)
 
         try:
-            async with session.post(
+            # SSE 流原样转发给客户端，要求上游不压缩
+            prepared_headers['accept-encoding'] = 'identity'
+            async with self._post_stream(
                 url,
-                json=request_data,
-                headers=prepared_headers,
-                # 优化流式响应配置
-                read_bufsize=8192,
-                # 禁用自动解压缩，处理原始流
-                auto_decompress=False,
+                # 已有编码好的请求体时直接发送，避免重新序列化
+                body if body is not None else orjson.dumps(request_data),
+                prepared_headers,
             ) as response:
                 response.raise_for_status()
 
                 logger.info(f"Successfully connected to streaming endpoint")
 
-                # 使用更健壮的流式读取方法
+                # 上游数据到达即原样转发（不解压），不按固定大小切分
                 try:
-                    while True:
-                        chunk = await response.content.read(8192)
-                        if not chunk:
-                            break
+                    async for chunk in response.aiter_raw():
                         yield chunk
-                except (aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                except httpx.TransportError as e:
                     logger.error(f"Streaming interrupted: {str(e)}")
                     # 发送SSE格式的错误信息
-                    error_data = {
-                        "error": {
-                            "type": "stream_interrupted",
-                            "message": f"Streaming interrupted due to: {str(e)}"
-                        }
-                    }
-                    error_chunk = f'event: error\ndata: {json.dumps(error_data)}\n\n'.encode('utf-8')
-                    yield error_chunk
+                    yield self._sse_error_frame("stream_interrupted", f"Streaming interrupted due to: {str(e)}")
                     return
 
                 logger.info(f"Streaming request completed successfully")
 
-        except asyncio.TimeoutError:
+        except httpx.TimeoutException:
             logger.error(f"Timeout error from Anthropic API: stream request timed out")
-            error_data = {
-                "error": {
-                    "type": "timeout_error",
-                    "message": "Request to Anthropic API timed out"
-                }
-            }
-            error_chunk = f'event: error\ndata: {json.dumps(error_data)}\n\n'.encode('utf-8')
-            yield error_chunk
+            yield self._timeout_error_frame
 
-        except aiohttp.ClientResponseError as e:
-            logger.error(f"HTTP error from Anthropic API: {e.status} - {str(e)}")
-            error_data = {
-                "error": {
-                    "type": "api_error",
-                    "message": f"Anthropic API returned status {e.status}: {str(e)}"
-                }
-            }
-            error_chunk = f'event: error\ndata: {json.dumps(error_data)}\n\n'.encode('utf-8')
-            yield error_chunk
+        except httpx.HTTPStatusError as e:
+            logger.error(f"HTTP error from Anthropic API: {e.response.status_code} - {str(e)}")
+            yield self._sse_error_frame("api_error", f"Anthropic API returned status {e.response.status_code}: {str(e)}")
 
-        except aiohttp.ClientError as e:
+        except httpx.HTTPError as e:
             logger.error(f"Request error: {str(e)}")
-            error_data = {
-                "error": {
-                    "type": "network_error",
-                    "message": f"Network error: {str(e)}"
-                }
-            }
-            error_chunk = f'event: error\ndata: {json.dumps(error_data)}\n\n'.encode('utf-8')
-            yield error_chunk
+            yield self._sse_error_frame("network_error", f"Network error: {str(e)}")
 
         except Exception as e:
             logger.error(f"Unexpected error during streaming: {str(e)}")
-            error_data = {
-                "error": {
-                    "type": "unknown_error",
-                    "message": f"Unexpected error: {str(e)}"
-                }
-            }
-            error_chunk = f'event: error\ndata: {json.dumps(error_data)}\n\n'.encode('utf-8')
-            yield error_chunk
+            yield self._sse_error_frame("unknown_error", f"Unexpected error: {str(e)}")
 
     async def _forward_to_anthropic(self, request_data: Dict[str, Any],
-                                 headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
-        """转发请求到Anthropic API"""
-        prepared_headers = self._prepare_headers(headers or {})
-        session = await self._get_session()
+                                 headers: Optional[Mapping[str, str]] = None,
+                                 body: Optional[bytes] = None) -> Union[Dict[str, Any], Response]:
+        """转发请求到Anthropic API
+
+        成功时返回包含上游原始响应体的 Response（保留 Content-Encoding，
+        不做解压和 JSON 重新编码）；上游返回错误状态时抛出 UpstreamHTTPError，
+        其他失败返回错误字典。
+        """
+        headers = headers or {}
+        prepared_headers = self._prepare_headers(headers)
+        prepared_headers['accept-encoding'] = self._negotiate_encoding(headers)
         url = self.messages_endpoint
 
         logger.info(f"Forwarding request to: {url}")
 
         try:
-            async with session.post(
+            async with self._post_stream(
                 url,
-                json=request_data,
-                headers=prepared_headers
+                # 已有编码好的请求体时直接发送，避免重新序列化
+                body if body is not None else orjson.dumps(request_data),
+                prepared_headers,
             ) as response:
-                response.raise_for_status()
+                if response.is_error:
+                    # 错误响应需要解码后解析错误信息
+                    await response.aread()
+                    response.raise_for_status()
+
+                # 保留上游压缩，直接把压缩后的原始字节转发给客户端
+                body = b''.join([chunk async for chunk in response.aiter_raw()])
+                response_headers = {}
+                content_encoding = response.headers.get('content-encoding')
+                if content_encoding:
+                    response_headers['content-encoding'] = content_encoding
 
-                response_data = await response.json()
                 logger.info(f"Successfully received response from Anthropic API")
-                return response_data
+                return Response(
+                    content=body,
+                    status_code=response.status_code,
+                    headers=response_headers,
+                    media_type=response.headers.get('content-type', 'application/json'),
+                )
 
-        except asyncio.TimeoutError:
+        except httpx.TimeoutException:
             logger.error(f"Timeout error from Anthropic API: request timed out after 120 seconds")
             return {
                 "error": {
@@ -437,22 +493,12 @@ class AnthropicRequestHandler:
                 }
             }
 
-        except aiohttp.ClientResponseError as e:
-            logger.error(f"HTTP error from Anthropic API: {e.status} - {await e.text()}")
-            error_response = {
-                "error": {
-                    "type": "api_error",
-                    "message": f"Anthropic API returned status {e.status}"
-                }
-            }
-            if e.headers.get('content-type', '').startswith('application/json'):
-                try:
-                    error_response = await e.json()
-                except:
-                    pass
-            return error_response
+        except httpx.HTTPStatusError as e:
+            logger.error(f"HTTP error from Anthropic API: {e.response.status_code} - {e.response.text}")
+            # 上游状态码通过异常带出，由端点原样返回给客户端
+            raise self._upstream_error(e.response) from e
 
-        except aiohttp.ClientError as e:
+        except httpx.HTTPError as e:
             logger.error(f"Request error: {str(e)}")
             return {
                 "error": {
@@ -472,22 +518,11 @@ class AnthropicRequestHandler:
 
     async def close(self):
         """清理资源"""
-        if self.session and not self.session.closed:
-            await self.session.close()
-            logger.info("HTTP session closed")
-
-    def __del__(self):
-        """清理资源"""
-        # 注意：__del 中不能使用 await，这里只是作为备用
-        if hasattr(self, 'session') and self.session and not self.session.closed:
-            try:
-                # 创建任务来关闭会话
-                import asyncio
-                loop = asyncio.get_event_loop()
-                if not loop.is_closed():
-                    asyncio.create_task(self.close())
-            except:
-                pass
+        if self.client and not self.client.is_closed:
+            await self.client.aclose()
+            logger.info("HTTP client closed")
+        # 释放对客户端及其连接池的引用，便于立即回收
+        self.client = None
 
 
 # 创建FastAPI应用
@@ -532,6 +567,8 @@ async def startup_event():
 
     # 初始化请求处理器
     request_handler = AnthropicRequestHandler(api_url, api_key, cache_control_ttl)
+    await request_handler.init_client()
+    app.state.handler = request_handler
 
     logger.info(f"Claude Proxy server started")
     logger.info(f"Target API URL: {api_url}")
@@ -574,12 +611,9 @@ async def models_endpoint(request: Request):
         raise HTTPException(status_code=503, detail="Service not initialized")
 
     try:
-        # 获取请求头
-        headers = dict(request.headers)
-
-        # 转发GET请求到Anthropic API
+        # 转发GET请求到Anthropic API（直接传入大小写不敏感的请求头，不转换为 dict）
         logger.info("Received models endpoint request")
-        response_data = await request_handler.handle_get_request("/v1/models", headers)
+        response_data = await request_handler.handle_get_request("/v1/models", request.headers)
 
         # 检查是否是错误响应
         if 'error' in response_data:
@@ -592,10 +626,14 @@ async def models_endpoint(request: Request):
                 status_code = 503
 
             logger.warning(f"Models request failed: {response_data}")
-            return JSONResponse(status_code=status_code, content=response_data)
+            return ORJSONResponse(status_code=status_code, content=response_data)
 
         logger.info("Models request completed successfully")
-        return JSONResponse(content=response_data)
+        return ORJSONResponse(content=response_data)
+
+    except UpstreamHTTPError as e:
+        logger.warning(f"Models request failed: {e.status_code} - {e.body}")
+        return ORJSONResponse(status_code=e.status_code, content=e.body)
 
     except Exception as e:
         logger.error(f"Unexpected error in models endpoint: {str(e)}")
@@ -614,12 +652,18 @@ async def messages_endpoint(request: Request):
         if not content_type.startswith('application/json'):
             raise HTTPException(status_code=400, detail="Content-Type must be application/json")
 
-        request_data = await request.json()
+        raw_body = await request.body()
+        request_data = orjson.loads(raw_body)
 
         # 检查是否为流式请求
         is_stream = request_data.get('stream', False)
-        request_data.pop("top_p", None)
-        request_data.pop("temperature", None)
+
+        # 记录端点是否修改了请求体；未修改时可以把原始字节直接转发给上游
+        body_modified = False
+        for field in _STRIP_FIELDS:
+            if field in request_data:
+                del request_data[field]
+                body_modified = True
 
         # 预处理模型名称：处理-thinking结尾的模型
         model_name = request_data.get('model', '')
@@ -635,20 +679,30 @@ async def messages_endpoint(request: Request):
             }
             request_data['max_tokens'] = 16384
 
+            body_modified = True
+
             logger.info(f"Processed thinking model: {model_name} -> {base_model} with thinking enabled")
 
-        # 获取请求头
-        headers = dict(request.headers)
+        # 端点修改过请求体时，不能再转发原始字节
+        if body_modified:
+            raw_body = None
+
+        # 获取请求头（Starlette Headers 大小写不敏感，直接传递，不转换为 dict）
+        headers = request.headers
 
         # 处理请求
         logger.info(f"Received {'stream' if is_stream else 'non-stream'} request")
-        logger.info(f"Request data: {json.dumps({k: v for k, v in request_data.items() if k != 'messages'}, ensure_ascii=False)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Request data: %s",
+                orjson.dumps({k: v for k, v in request_data.items() if k != 'messages'}, option=orjson.OPT_NON_STR_KEYS).decode()
+            )
 
         if is_stream:
             # 流式回复
             logger.info("Processing as streaming request")
             return StreamingResponse(
-                request_handler.handle_stream_request(request_data, headers),
+                request_handler.handle_stream_request(request_data, headers, raw_body),
                 media_type="text/event-stream",
                 headers={
                     "Cache-Control": "no-cache",
@@ -660,7 +714,12 @@ async def messages_endpoint(request: Request):
         else:
             # 非流式回复
             logger.info("Processing as non-streaming request")
-            response_data = await request_handler.handle_request(request_data, headers)
+            response_data = await request_handler.handle_request(request_data, headers, raw_body)
+
+            # 上游成功响应的原始字节直接返回
+            if isinstance(response_data, Response):
+                logger.info("Request completed successfully")
+                return response_data
 
             # 检查是否是错误响应
             if 'error' in response_data:
@@ -677,12 +736,16 @@ async def messages_endpoint(request: Request):
                     status_code = 502
 
                 logger.warning(f"Request failed: {response_data}")
-                return JSONResponse(status_code=status_code, content=response_data)
+                return ORJSONResponse(status_code=status_code, content=response_data)
 
             logger.info("Request completed successfully")
-            return JSONResponse(content=response_data)
+            return ORJSONResponse(content=response_data)
+
+    except UpstreamHTTPError as e:
+        logger.warning(f"Request failed: {e.status_code} - {e.body}")
+        return ORJSONResponse(status_code=e.status_code, content=e.body)
 
-    except json.JSONDecodeError:
+    except orjson.JSONDecodeError:
         logger.error("Invalid JSON in request body")
         raise HTTPException(status_code=400, detail="Invalid JSON in request body")
 
@@ -699,14 +762,20 @@ if __name__ == "__main__":
     # 读取服务器配置
     host = os.getenv('PROXY_HOST', '0.0.0.0')
     port = int(os.getenv('PROXY_PORT', 8080))
+    # 多个 worker 进程共享监听端口；每个 worker 在 startup_event 中独立读取配置、
+    # 创建自己的请求处理器和上游连接池
+    workers = int(os.getenv('PROXY_WORKERS', os.cpu_count() or 1))
 
-    logger.info(f"Starting Claude Proxy server on {host}:{port}")
+    logger.info(f"Starting Claude Proxy server on {host}:{port} with {workers} workers")
 
-    # 启动服务器
+    # 启动服务器（使用 uvloop 事件循环和 httptools HTTP 解析器）
     uvicorn.run(
         "anthropic_proxy:app",
         host=host,
         port=port,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
         reload=False,
         log_level=os.getenv('LOG_LEVEL', 'info').lower()
     )
@@ -1,14 +1,21 @@
 import os
-import json
+import time
+import hashlib
+import socket
 import logging
 import asyncio
-from typing import Optional, Dict, Any, AsyncGenerator
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, Annotated, AsyncGenerator, AsyncIterator, Mapping, Tuple
 from fastapi import FastAPI, Request, Response, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import ORJSONResponse
+from starlette.types import Receive, Scope, Send
 import uvicorn
 from dotenv import load_dotenv
 import aiohttp
+import msgspec
+import orjson
+from cachetools import TLRUCache
 
 # 加载环境变量，命令行环境变量优先级更高
 load_dotenv()  # 不覆盖现有环境变量
@@ -21,30 +28,83 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# 创建FastAPI应用
-app = FastAPI(
-    title="OpenAI Format Proxy",
-    description="A proxy server for OpenAI API with cache_control support",
-    version="1.0.0"
-)
-
-# 添加CORS中间件
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
 # 全局请求处理器
 request_handler: Optional['OpenAIRequestHandler'] = None
 
 
+def _nodelay_socket_factory(addr_info) -> socket.socket:
+    """创建上游 socket 并显式开启 TCP_NODELAY，避免小包被 Nagle 算法延迟发送"""
+    family, type_, proto, _, _ = addr_info
+    sock = socket.socket(family=family, type=type_, proto=proto)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+class ChatMessage(msgspec.Struct):
+    """请求中单条消息的格式约束（只校验，不用于转发）"""
+    role: str
+    content: Any
+
+
+class ChatCompletionRequest(msgspec.Struct):
+    """/v1/chat/completions 请求的格式约束，未声明的字段会被忽略"""
+    model: str
+    messages: Annotated[list[ChatMessage], msgspec.Meta(min_length=1)]
+
+
+class SSEResponse(Response):
+    """直接通过 ASGI send 转发 SSE 字节流的响应，省去 StreamingResponse 的包装层"""
+
+    media_type = "text/event-stream"
+
+    def __init__(self, content: AsyncGenerator[bytes, None],
+                 headers: Optional[Mapping[str, str]] = None):
+        # 不调用 Response.__init__，避免渲染空 body 并写入 content-length
+        self.body_iterator = content
+        self.status_code = 200
+        self.background = None
+        self.init_headers(headers)
+
+    async def _stream_body(self, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        async for chunk in self.body_iterator:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    @staticmethod
+    async def _listen_for_disconnect(receive: Receive) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                logger.info("Client disconnected, stopping stream forwarding")
+                return
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            # 转发与断开监听并行，任一方结束即取消另一方，客户端断开后不再继续消耗上游 token
+            async with asyncio.TaskGroup() as tg:
+                stream_task = tg.create_task(self._stream_body(send))
+                listen_task = tg.create_task(self._listen_for_disconnect(receive))
+                stream_task.add_done_callback(lambda _: listen_task.cancel())
+                listen_task.add_done_callback(lambda _: stream_task.cancel())
+        except BaseExceptionGroup as eg:
+            # 另一个任务随之被取消，通常只有一个异常：抛出原始异常，让 Starlette 的错误中间件和日志看到真实错误
+            if len(eg.exceptions) == 1:
+                raise eg.exceptions[0] from None
+            raise
+        finally:
+            # 确保上游连接随生成器一起释放
+            await self.body_iterator.aclose()
+
+
 class OpenAIRequestHandler:
     """OpenAI API 请求处理器，负责转发请求并添加 cache_control 支持"""
 
-    def __init__(self, api_url: str, api_key: str):
+    # 所有请求共享的 cache_control 及空文本块，只被序列化、从不修改
+    _CACHE_CTRL = {"type": "ephemeral"}
+    _EMPTY_TEXT_BLOCK = {"type": "text", "text": "", "cache_control": _CACHE_CTRL}
+
+    def __init__(self, api_url: str, api_key: str, response_cache_enabled: bool = False):
         self.api_url = api_url.rstrip('/')
         self.api_key = api_key
         self.session: Optional[aiohttp.ClientSession] = None
@@ -56,6 +116,32 @@ class OpenAIRequestHandler:
         # 构建聊天完成端点
         self.chat_endpoint = f"{self.api_url}/chat/completions"
 
+        # 转发请求头固定不变，只构建一次，所有请求共享（不要修改）
+        self._forward_headers = {
+            # 使用标准的 Authorization 头（大写 A，与 OpenRouter 官方示例一致）
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json',
+            # 添加自定义header
+            'HTTP-Referer': 'https://api.pezayo.com',
+            'X-Title': 'One hub 站点',
+        }
+        # 流式请求要求上游不压缩 SSE，原始字节可直接转发给客户端
+        self._stream_headers = {**self._forward_headers, 'Accept-Encoding': 'identity'}
+
+        # 非流式响应的精确匹配缓存，条目值为 (响应, TTL秒数)，按条目各自的 TTL 过期
+        # 默认关闭，可由 OPENAI_PROXY_RESPONSE_CACHE 全局开启或由请求的 cache 字段逐个开启
+        self.response_cache_enabled = response_cache_enabled
+        self.response_cache: TLRUCache = TLRUCache(
+            maxsize=1024,
+            ttu=lambda key, value, now: now + value[1],
+            timer=time.monotonic,
+        )
+        self.default_cache_ttl = 3600
+
+        # 模型列表缓存 (获取时间, 响应)，模型列表很少变化，缓存5分钟
+        self._models_cache: Optional[Tuple[float, Dict[str, Any]]] = None
+        self.models_cache_ttl = 300
+
         logger.info(f"Initialized OpenAI Request Handler with cache_control support")
         logger.info(f"Target API URL: {self.api_url}")
 
@@ -84,184 +170,200 @@ class OpenAIRequestHandler:
                 connector=aiohttp.TCPConnector(
                     limit=50,  # 减少总连接池大小避免资源竞争
                     limit_per_host=10,  # 减少每个主机的连接数
-                    ttl_dns_cache=300,
+                    # 上游只有一个固定主机，DNS 结果缓存1小时，避免连接时反复解析
+                    ttl_dns_cache=3600,
                     use_dns_cache=True,
-                    # 启用keep-alive连接
-                    keepalive_timeout=30,
-                    # 启用TCP缓冲区自动调整
+                    # 空闲连接保持75秒，连续请求可复用同一 TLS 连接，避免重复握手
+                    keepalive_timeout=75,
+                    force_close=False,
+                    # 及时清理已关闭的 TLS 传输
                     enable_cleanup_closed=True,
+                    socket_factory=_nodelay_socket_factory,
                 )
             )
             self.proxy_url = proxy_url  # 保存代理URL供请求使用
         return self.session
 
-    def _prepare_headers(self, original_headers: Dict[str, str]) -> Dict[str, str]:
-        """准备请求头，使用配置中的默认API Key"""
-        headers = {}
-
-        # 使用标准的 Authorization 头（大写 A，与 OpenRouter 官方示例一致）
-        headers['Authorization'] = f'Bearer {self.api_key}'
-        headers['Content-Type'] = 'application/json'
-        # 添加自定义header
-        headers['HTTP-Referer'] = 'https://api.pezayo.com'
-        headers['X-Title'] = 'One hub 站点'
-        logger.info("Using configured default API key")
-
-        return headers
+    async def _warm_up_connection(self) -> None:
+        """预先解析上游域名并建立连接，让第一个真实请求可以直接复用已建立的连接"""
+        session = await self._get_session()
+        try:
+            async with session.head(self.api_url, proxy=self.proxy_url or None) as response:
+                await response.read()
+            logger.info("Upstream connection pool warmed up")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Failed to warm up upstream connection: {str(e)}")
+
+    @staticmethod
+    def _strip_cache_control(message: Dict[str, Any]) -> Dict[str, Any]:
+        """返回去掉 cache_control 的消息；没有需要清理的字段时直接返回原对象，不做复制"""
+        content = message.get('content')
+        blocks_dirty = isinstance(content, list) and any(
+            isinstance(block, dict) and 'cache_control' in block for block in content
+        )
+        if 'cache_control' not in message and not blocks_dirty:
+            return message
+
+        cleaned_message = {k: v for k, v in message.items() if k != 'cache_control'}
+        if blocks_dirty:
+            cleaned_message['content'] = [
+                {k: v for k, v in block.items() if k != 'cache_control'}
+                if isinstance(block, dict) and 'cache_control' in block else block
+                for block in content
+            ]
+        return cleaned_message
 
     def _add_cache_control_to_messages(self, messages: list) -> list:
-        """为消息添加 cache_control，遵循 OpenRouter 规范"""
+        """为消息添加 cache_control，遵循 OpenRouter 规范
+
+        只复制带有 cache_control 的消息和最后一条消息，其余消息直接复用原对象。
+        """
         if not messages:
             return messages
 
-        standardized_messages = []
-
-        for message in messages:
-            cleaned_message = message.copy()
-
-            # 清理现有的 cache_control
-            if 'cache_control' in cleaned_message:
-                del cleaned_message['cache_control']
-
-            content = message.get('content', [])
-            if isinstance(content, list):
-                cleaned_content = []
-                for content_block in content:
-                    if isinstance(content_block, dict):
-                        # 移除 cache_control 字段，保留其他字段
-                        cleaned_block = {k: v for k, v in content_block.items() if k != 'cache_control'}
-                        cleaned_content.append(cleaned_block)
-                    else:
-                        cleaned_content.append(content_block)
-                cleaned_message['content'] = cleaned_content
-
-            standardized_messages.append(cleaned_message)
-
-        # 在最后一条消息添加标准的 cache_control
-        if standardized_messages:
-            last_message = standardized_messages[-1]
-            content = last_message.get('content', [])
-
-            if isinstance(content, list):
-                if content:
-                    # 如果有 content 块，在最后一个块中添加 cache_control
-                    if isinstance(content[-1], dict):
-                        content[-1]['cache_control'] = {"type": "ephemeral"}
-                    else:
-                        # 如果最后一个块不是 dict，创建新的 dict 块
-                        content.append({
-                            "type": "text",
-                            "text": str(content[-1]) if content[-1] else "",
-                            "cache_control": {"type": "ephemeral"}
-                        })
-                else:
-                    # 如果 content 为空，创建新的 content 块
-                    content = [{
-                        "type": "text",
-                        "text": "",
-                        "cache_control": {"type": "ephemeral"}
-                    }]
-            elif isinstance(content, str):
-                # 将字符串转换为 list 格式并添加 cache_control
-                last_message['content'] = [
-                    {
-                        "type": "text",
-                        "text": content,
-                        "cache_control": {"type": "ephemeral"}
-                    }
-                ]
+        standardized_messages = [self._strip_cache_control(message) for message in messages[:-1]]
+
+        # 最后一条消息总是浅拷贝，只替换最后一个 content 块
+        last_message = dict(self._strip_cache_control(messages[-1]))
+        content = last_message.get('content')
+
+        if isinstance(content, str):
+            # 将字符串转换为 list 格式并添加 cache_control
+            last_message['content'] = [{"type": "text", "text": content, "cache_control": self._CACHE_CTRL}]
+        elif isinstance(content, list) and content:
+            if isinstance(content[-1], dict):
+                # 在最后一个块中添加 cache_control
+                last_message['content'] = content[:-1] + [{**content[-1], 'cache_control': self._CACHE_CTRL}]
             else:
-                # 如果 content 为 None 或其他格式，创建新的 content
-                last_message['content'] = [
-                    {
-                        "type": "text",
-                        "text": "",
-                        "cache_control": {"type": "ephemeral"}
-                    }
-                ]
+                # 如果最后一个块不是 dict，追加新的 dict 块
+                last_message['content'] = content + [{
+                    "type": "text",
+                    "text": str(content[-1]) if content[-1] else "",
+                    "cache_control": self._CACHE_CTRL
+                }]
+        else:
+            # 如果 content 为空、None 或其他格式，创建新的 content
+            last_message['content'] = [self._EMPTY_TEXT_BLOCK]
+
+        standardized_messages.append(last_message)
 
-        logger.info(f"Added cache_control to last message (no TTL for OpenRouter)")
+        logger.debug("Added cache_control to last message (no TTL for OpenRouter)")
         return standardized_messages
 
     def _validate_openai_request(self, request_data: Dict[str, Any]) -> bool:
         """验证OpenAI请求格式"""
-        required_fields = ['model', 'messages']
+        # 用 msgspec 在 C 层一次性校验请求结构，原始字典保持不变用于转发
+        try:
+            msgspec.convert(request_data, ChatCompletionRequest)
+        except msgspec.ValidationError as e:
+            logger.error(f"Invalid request: {str(e)}")
+            return False
+        return True
 
-        for field in required_fields:
-            if field not in request_data:
-                logger.error(f"Missing required field: {field}")
-                return False
+    @staticmethod
+    def _response_cache_key(request_data: Dict[str, Any]) -> str:
+        """根据转发给上游的完整请求体（不含 stream）计算缓存键（排序键后的 SHA256）"""
+        key_data = {k: v for k, v in request_data.items() if k != 'stream'}
+        return hashlib.sha256(orjson.dumps(key_data, option=orjson.OPT_SORT_KEYS)).hexdigest()
 
-        messages = request_data.get('messages', [])
-        if not isinstance(messages, list) or len(messages) == 0:
-            logger.error("Messages must be a non-empty list")
+    @staticmethod
+    def _is_cacheable_response(response_data: Dict[str, Any]) -> bool:
+        """错误响应和包含 tool_calls 的响应不缓存"""
+        if 'error' in response_data:
             return False
-
-        for message in messages:
-            if not isinstance(message, dict):
-                logger.error("Each message must be a dictionary")
-                return False
-            if 'role' not in message or 'content' not in message:
-                logger.error("Each message must have 'role' and 'content' fields")
+        for choice in response_data.get('choices') or []:
+            message = choice.get('message') or {}
+            if message.get('tool_calls'):
                 return False
-
         return True
 
-    async def handle_request(self, request_data: Dict[str, Any],
-                           headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
-        """处理OpenAI API请求"""
-        headers = headers or {}
+    async def handle_request(self, request_data: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+        """处理OpenAI API请求，返回 (响应数据, 缓存状态)
 
+        缓存状态为 HIT、MISS 或 BYPASS。请求中的 cache 字段（true、{"ttl": N} 开启，
+        false、{"bypass": true} 关闭，缺省时取全局开关）仅由代理使用，不会转发给上游。
+        """
         # 验证请求格式
         if not self._validate_openai_request(request_data):
             raise ValueError("Invalid OpenAI request format")
 
+        cache_options = request_data.pop('cache', None)
+        if cache_options is None:
+            use_cache = self.response_cache_enabled
+        elif isinstance(cache_options, dict):
+            use_cache = not cache_options.get('bypass')
+        else:
+            use_cache = cache_options is True
+        if not isinstance(cache_options, dict):
+            cache_options = {}
+
+        if not use_cache:
+            cache_key = None
+            cache_status = "BYPASS"
+        else:
+            cache_key = self._response_cache_key(request_data)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                logger.info("Response cache hit")
+                return cached[0], "HIT"
+            cache_status = "MISS"
+
         messages = request_data.get('messages', [])
 
         # 添加 cache_control 到最后一条消息
         cached_messages = self._add_cache_control_to_messages(messages)
 
-        # 更新请求中的消息
-        cached_request = request_data.copy()
-        cached_request['messages'] = cached_messages
+        # 更新请求中的消息（一次构建新字典，不先复制再赋值）
+        cached_request = request_data | {'messages': cached_messages}
 
         logger.info("Request processed with OpenRouter cache_control strategy")
 
         # 转发请求给目标API
-        response_data = await self._forward_to_api(cached_request, headers)
-        return response_data
+        response_data = await self._forward_to_api(cached_request)
+
+        if cache_key is not None and self._is_cacheable_response(response_data):
+            ttl = cache_options.get('ttl', self.default_cache_ttl)
+            if isinstance(ttl, (int, float)) and ttl > 0:
+                self.response_cache[cache_key] = (response_data, ttl)
 
-    async def handle_stream_request(self, request_data: Dict[str, Any],
-                                  headers: Optional[Dict[str, str]] = None) -> AsyncGenerator[bytes, None]:
+        return response_data, cache_status
+
+    async def handle_stream_request(self, request_data: Dict[str, Any]) -> AsyncGenerator[bytes, None]:
         """处理流式 OpenAI API 请求"""
-        headers = headers or {}
 
         # 验证请求格式
         if not self._validate_openai_request(request_data):
             raise ValueError("Invalid OpenAI request format")
 
+        # 代理缓存选项不转发给上游，流式请求不使用响应缓存
+        request_data.pop('cache', None)
+
         messages = request_data.get('messages', [])
 
         # 添加 cache_control 到最后一条消息
         cached_messages = self._add_cache_control_to_messages(messages)
 
-        # 更新请求中的消息
-        cached_request = request_data.copy()
-        cached_request['messages'] = cached_messages
-
         # 转换 thinking 字段为 reasoning 字段（OpenRouter 格式）
-        claude_reasoning = cached_request.get("thinking", {"type": "disabled", "budget_tokens": 3276})
-        cached_request['reasoning'] = {"enabled": claude_reasoning['type'] == "enabled", "max_tokens": claude_reasoning['budget_tokens']}
+        thinking = request_data.get("thinking")
+        if thinking is None:
+            reasoning = {"enabled": False, "max_tokens": 3276}
+        else:
+            reasoning = {"enabled": thinking.get("type") == "enabled", "max_tokens": thinking.get("budget_tokens", 3276)}
+
+        # 一次构建转发的请求字典，同时替换消息并加入 reasoning
+        cached_request = {**request_data, 'messages': cached_messages, 'reasoning': reasoning}
 
         logger.info("Stream request processed with OpenRouter cache_control strategy")
 
         # 转发流式请求给目标API
-        async for chunk in self._forward_stream_to_api(cached_request, headers):
+        async for chunk in self._forward_stream_to_api(cached_request):
             yield chunk
 
-    async def handle_models_request(self, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
-        """处理models端点请求"""
-        prepared_headers = self._prepare_headers(headers or {})
+    async def handle_models_request(self) -> Dict[str, Any]:
+        """处理models端点请求，成功的响应缓存 models_cache_ttl 秒"""
+        if self._models_cache and time.monotonic() - self._models_cache[0] < self.models_cache_ttl:
+            return self._models_cache[1]
+
         session = await self._get_session()
 
         # 构建完整的URL
@@ -270,12 +372,15 @@ class OpenAIRequestHandler:
         else:
             models_url = f"{self.api_url}/v1/models"
 
-        logger.info(f"Forwarding models request to: {models_url}")
+        logger.debug("Forwarding models request to: %s", models_url)
 
         try:
-            async with session.get(models_url, headers=prepared_headers) as response:
+            async with session.get(models_url, headers=self._forward_headers) as response:
                 if response.headers.get('content-type', '').startswith('application/json'):
-                    return await response.json()
+                    response_data = orjson.loads(await response.read())
+                    if response.status == 200 and 'error' not in response_data:
+                        self._models_cache = (time.monotonic(), response_data)
+                    return response_data
                 else:
                     return {"data": await response.text()}
 
@@ -288,20 +393,18 @@ class OpenAIRequestHandler:
                 }
             }
 
-    async def _forward_to_api(self, request_data: Dict[str, Any],
-                             headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    async def _forward_to_api(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
         """转发请求到目标API"""
-        prepared_headers = self._prepare_headers(headers or {})
         session = await self._get_session()
         url = self.chat_endpoint
 
-        logger.info(f"Forwarding request to: {url}")
+        logger.debug("Forwarding request to: %s", url)
 
         try:
             # 在请求级别设置代理
             kwargs = {
-                "json": request_data,
-                "headers": prepared_headers
+                "data": orjson.dumps(request_data),
+                "headers": self._forward_headers
             }
             if hasattr(self, 'proxy_url') and self.proxy_url:
                 kwargs["proxy"] = self.proxy_url
@@ -309,8 +412,8 @@ class OpenAIRequestHandler:
             async with session.post(url, **kwargs) as response:
                 response.raise_for_status()
 
-                response_data = await response.json()
-                logger.info(f"Successfully received response from API")
+                response_data = orjson.loads(await response.read())
+                logger.debug("Successfully received response from API")
                 return response_data
 
         except Exception as e:
@@ -322,23 +425,20 @@ class OpenAIRequestHandler:
                 }
             }
 
-    async def _forward_stream_to_api(self, request_data: Dict[str, Any],
-                                    headers: Optional[Dict[str, str]] = None) -> AsyncGenerator[bytes, None]:
+    async def _forward_stream_to_api(self, request_data: Dict[str, Any]) -> AsyncGenerator[bytes, None]:
         """转发流式请求到目标API"""
-        prepared_headers = self._prepare_headers(headers or {})
-        logger.info(f"{prepared_headers}")
         session = await self._get_session()
         url = self.chat_endpoint
 
-        logger.info(f"Forwarding stream request to: {url}")
+        logger.debug("Forwarding stream request to: %s", url)
 
         try:
             # 在请求级别设置代理
             kwargs = {
-                "json": request_data,
-                "headers": prepared_headers,
-                # 增加流式响应的缓冲区大小
-                "read_bufsize": 8192,
+                "data": orjson.dumps(request_data),
+                "headers": self._stream_headers,
+                # 使用 64 KiB 读缓冲区，减少系统调用和事件循环唤醒次数
+                "read_bufsize": 65536,
                 # 禁用自动解压缩，处理原始流
                 "auto_decompress": False,
             }
@@ -350,12 +450,9 @@ class OpenAIRequestHandler:
 
                 logger.info(f"Successfully connected to streaming endpoint")
 
-                # 使用更健壮的流式读取方法
+                # 缓冲区中已有多少数据就转发多少，不按固定大小重新切分
                 try:
-                    while True:
-                        chunk = await response.content.read(8192)
-                        if not chunk:
-                            break
+                    async for chunk in response.content.iter_any():
                         yield chunk
                 except (aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
                     logger.error(f"Streaming interrupted: {str(e)}")
@@ -366,7 +463,7 @@ class OpenAIRequestHandler:
                             "message": f"Streaming interrupted due to: {str(e)}"
                         }
                     }
-                    error_chunk = f'data: {json.dumps(error_data)}\n\n'.encode('utf-8')
+                    error_chunk = b'data: ' + orjson.dumps(error_data) + b'\n\n'
                     yield error_chunk
                     return
 
@@ -381,7 +478,7 @@ class OpenAIRequestHandler:
                     "message": f"HTTP {e.status}: {e.message}"
                 }
             }
-            error_chunk = f'data: {json.dumps(error_data)}\n\n'.encode('utf-8')
+            error_chunk = b'data: ' + orjson.dumps(error_data) + b'\n\n'
             yield error_chunk
 
         except (asyncio.TimeoutError, aiohttp.ServerTimeoutError) as e:
@@ -393,7 +490,7 @@ class OpenAIRequestHandler:
                     "message": f"Request timeout: {str(e)}"
                 }
             }
-            error_chunk = f'data: {json.dumps(error_data)}\n\n'.encode('utf-8')
+            error_chunk = b'data: ' + orjson.dumps(error_data) + b'\n\n'
             yield error_chunk
 
         except Exception as e:
@@ -405,7 +502,7 @@ class OpenAIRequestHandler:
                     "message": f"Streaming request failed: {str(e)}"
                 }
             }
-            error_chunk = f'data: {json.dumps(error_data)}\n\n'.encode('utf-8')
+            error_chunk = b'data: ' + orjson.dumps(error_data) + b'\n\n'
             yield error_chunk
 
     async def close(self):
@@ -415,9 +512,9 @@ class OpenAIRequestHandler:
             logger.info("OpenAI HTTP session closed")
 
 
-@app.on_event("startup")
-async def startup_event():
-    """应用启动时初始化"""
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """应用生命周期：启动时初始化请求处理器并建立上游连接，关闭时清理资源"""
     global request_handler
 
     # 读取配置
@@ -427,11 +524,16 @@ async def startup_event():
     if not api_key:
         raise ValueError("OPENROUTER_API_KEY environment variable is required")
 
+    # 响应缓存默认关闭，需显式开启
+    response_cache_enabled = os.getenv('OPENAI_PROXY_RESPONSE_CACHE', 'false').lower() in ('1', 'true', 'yes')
+
     # 初始化请求处理器
-    request_handler = OpenAIRequestHandler(api_url, api_key)
+    request_handler = OpenAIRequestHandler(api_url, api_key, response_cache_enabled)
+    await request_handler._warm_up_connection()
 
     logger.info("OpenAI Format Proxy server started")
     logger.info(f"Target API URL: {api_url}")
+    logger.info(f"Response cache: {'enabled' if response_cache_enabled else 'disabled (opt-in per request)'}")
 
     # 显示API Key信息（只显示前几位和后几位）
     if len(api_key) > 20:
@@ -447,13 +549,31 @@ async def startup_event():
     else:
         logger.warning("No .env file found, using environment variables")
 
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    """应用关闭时清理资源"""
-    if request_handler:
+    try:
+        yield
+    finally:
         await request_handler.close()
-    logger.info("OpenAI Format Proxy server shutdown")
+        logger.info("OpenAI Format Proxy server shutdown")
+
+
+# 创建FastAPI应用
+app = FastAPI(
+    title="OpenAI Format Proxy",
+    description="A proxy server for OpenAI API with cache_control support",
+    version="1.0.0",
+    # 所有端点默认使用 orjson 序列化响应
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
+)
+
+# 添加CORS中间件
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
 
 
 @app.get("/")
@@ -485,15 +605,14 @@ async def models_endpoint(request: Request):
         raise HTTPException(status_code=503, detail="Service not initialized")
 
     try:
-        headers = dict(request.headers)
-        response_data = await request_handler.handle_models_request(headers)
+        response_data = await request_handler.handle_models_request()
 
         if 'error' in response_data:
             logger.warning(f"Models request failed: {response_data}")
-            return JSONResponse(status_code=500, content=response_data)
+            return ORJSONResponse(status_code=500, content=response_data)
 
         logger.info("Models request completed successfully")
-        return JSONResponse(content=response_data)
+        return ORJSONResponse(content=response_data)
 
     except Exception as e:
         logger.error(f"Unexpected error in models endpoint: {str(e)}")
@@ -512,27 +631,24 @@ async def chat_completions_endpoint(request: Request):
         if not content_type.startswith('application/json'):
             raise HTTPException(status_code=400, detail="Content-Type must be application/json")
 
-        request_data = await request.json()
+        request_data = orjson.loads(await request.body())
 
         # 检查是否为流式请求
         is_stream = request_data.get('stream', False)
 
-        logger.info(f"is_stream {is_stream}")
-
-        # 获取请求头
-        headers = dict(request.headers)
-        logger.info(f"Header: {headers}")
-
         # 处理请求
         logger.info(f"Received {'stream' if is_stream else 'non-stream'} chat completion request")
-        logger.info(f"Request data: {json.dumps({k: v for k, v in request_data.items() if k != 'messages'}, ensure_ascii=False)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Request data: %s",
+                orjson.dumps({k: v for k, v in request_data.items() if k != 'messages'}, option=orjson.OPT_NON_STR_KEYS).decode()
+            )
 
         if is_stream:
             # 流式回复
             logger.info("Processing as streaming request")
-            return StreamingResponse(
-                request_handler.handle_stream_request(request_data, headers),
-                media_type="text/event-stream",
+            return SSEResponse(
+                request_handler.handle_stream_request(request_data),
                 headers={
                     "Cache-Control": "no-cache",
                     "Connection": "keep-alive",
@@ -543,17 +659,18 @@ async def chat_completions_endpoint(request: Request):
         else:
             # 非流式回复
             logger.info("Processing as non-streaming request")
-            response_data = await request_handler.handle_request(request_data, headers)
+            response_data, cache_status = await request_handler.handle_request(request_data)
 
             # 检查是否是错误响应
             if 'error' in response_data:
                 logger.warning(f"Request failed: {response_data}")
-                return JSONResponse(status_code=500, content=response_data)
+                return ORJSONResponse(status_code=500, content=response_data,
+                                    headers={"X-Cache": cache_status})
 
             logger.info("Request completed successfully")
-            return JSONResponse(content=response_data)
+            return ORJSONResponse(content=response_data, headers={"X-Cache": cache_status})
 
-    except json.JSONDecodeError:
+    except orjson.JSONDecodeError:
         logger.error("Invalid JSON in request body")
         raise HTTPException(status_code=400, detail="Invalid JSON in request body")
 
@@ -570,14 +687,22 @@ if __name__ == "__main__":
     # 读取服务器配置
     host = os.getenv('OPENAI_PROXY_HOST', '0.0.0.0')
     port = int(os.getenv('OPENAI_PROXY_PORT', 9998))
+    # 多个 worker 进程共享监听端口；每个 worker 在 lifespan 中独立创建
+    # 自己的请求处理器、上游连接池和响应缓存
+    workers = int(os.getenv('OPENAI_PROXY_WORKERS', os.cpu_count() or 1))
 
-    logger.info(f"Starting OpenAI Format Proxy server on {host}:{port}")
+    logger.info(f"Starting OpenAI Format Proxy server on {host}:{port} with {workers} workers")
 
-    # 启动服务器
+    # 启动服务器（使用 uvloop 事件循环和 httptools HTTP 解析器）
     uvicorn.run(
         "openrouter_proxy:app",
         host=host,
         port=port,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        # 应用自身已记录请求日志，关闭 uvicorn 的访问日志
+        access_log=False,
         reload=False,
         log_level=os.getenv('LOG_LEVEL', 'info').lower()
     )
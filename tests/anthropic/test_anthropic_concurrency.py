@@ -13,316 +13,439 @@ sys.path.insert(0, str(project_root))
 
 import asyncio
 import aiohttp
+import socket
 import time
-import json
-from typing import List, Dict
+import orjson
+from typing import Awaitable, Callable, List, Dict, NamedTuple, Optional
 import statistics
+from array import array
 from dotenv import load_dotenv
 
 # 加载环境变量
 load_dotenv()
 
+# 所有请求共用的请求头
+HEADERS = {
+    "Content-Type": "application/json",
+    "x-api-key": "test-key"
+}
+
+# 请求体模板只序列化一次，每个请求只需用 % 填入请求编号
+REQUEST_TEMPLATE = orjson.dumps({
+    "model": "claude-sonnet-4-5-20250929",
+    "max_tokens": 20,
+    "messages": [
+        {"role": "user", "content": "并发测试请求 #%d，请简短回复"}
+    ]
+})
+
+STREAM_REQUEST_TEMPLATE = orjson.dumps({
+    "model": "claude-sonnet-4-5-20250929",
+    "max_tokens": 30,
+    "stream": True,
+    "messages": [
+        {"role": "user", "content": "流式并发测试 #%d"}
+    ]
+})
+
+# 请求超时：连接阶段快速失败（连接不上时尽快释放 worker），读取阶段按两次数据之间的间隔限制
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=120, connect=2, sock_connect=2, sock_read=60)
+
+# 启动前健康检查的超时（aiohttp 的 timeout 参数应传 ClientTimeout 而不是数字）
+HEALTH_CHECK_TIMEOUT = aiohttp.ClientTimeout(total=5)
+
 def get_anthropic_proxy_url():
     """获取Anthropic代理服务器URL"""
     host = os.getenv('PROXY_HOST', 'localhost')
     port = os.getenv('PROXY_PORT', '8080')
     return f"http://{host}:{port}"
 
-async def single_request(session: aiohttp.ClientSession, request_id: int, url: str) -> Dict:
+def _socket_factory(addr_info) -> socket.socket:
+    """创建客户端 socket：开启 TCP_NODELAY 避免小请求体被 Nagle 算法延迟，开启 SO_KEEPALIVE 保活复用连接"""
+    family, type_, proto, _, _ = addr_info
+    sock = socket.socket(family=family, type=type_, proto=proto)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    return sock
+
+# 测试场景
+TEST_SCENARIOS = [
+    {"concurrency": 1, "total": 5, "name": "基准测试"},
+    {"concurrency": 5, "total": 20, "name": "轻度并发"},
+    {"concurrency": 10, "total": 50, "name": "中度并发"},
+    {"concurrency": 20, "total": 100, "name": "高度并发"},
+]
+
+def create_session(limit: int = 200) -> aiohttp.ClientSession:
+    """创建测试会话，连接池上限 limit 应不小于并发 worker 数
+
+    代理由 uvicorn 以明文 HTTP/1.1 提供服务（不支持 h2c），无法用 HTTP/2 把请求合并到单个连接；
+    这里限制连接数并保持 keep-alive 复用，每个连接在整个测试中只建立一次。
+    """
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit,
+        # 代理主机名只在首次连接时解析，之后在整个测试期间命中 DNS 缓存
+        use_dns_cache=True,
+        ttl_dns_cache=600,
+        enable_cleanup_closed=True,
+        keepalive_timeout=75,
+        force_close=False,
+        socket_factory=_socket_factory,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=REQUEST_TIMEOUT,
+    )
+
+class RequestResult(NamedTuple):
+    """单个请求的结果（流式请求的 response_length 为累计接收字节数）"""
+    request_id: int
+    success: bool
+    status_code: Optional[int]
+    response_time: float
+    response_length: int
+    error: Optional[str]
+    chunks_received: int = 0
+
+async def single_request(session: aiohttp.ClientSession, request_id: int, url: str) -> RequestResult:
     """发送单个请求"""
-    start_time = time.time()
-
-    request_data = {
-        "model": "claude-sonnet-4-5-20250929",
-        "max_tokens": 20,
-        "messages": [
-            {"role": "user", "content": f"并发测试请求 #{request_id}，请简短回复"}
-        ]
-    }
+    start_time = time.perf_counter()
 
     try:
         async with session.post(
             url,
-            json=request_data,
-            headers={
-                "Content-Type": "application/json",
-                "x-api-key": "test-key"
-            },
-            timeout=aiohttp.ClientTimeout(total=60)
+            data=REQUEST_TEMPLATE % request_id,
+            headers=HEADERS,
+            timeout=REQUEST_TIMEOUT
         ) as response:
 
-            elapsed_time = time.time() - start_time
+            elapsed_time = time.perf_counter() - start_time
 
             if response.status == 200:
-                result = await response.json()
-                return {
-                    "request_id": request_id,
-                    "success": True,
-                    "status_code": response.status,
-                    "response_time": elapsed_time,
-                    "response_length": len(json.dumps(result)),
-                    "error": None
-                }
+                # 只需要响应大小，直接取原始字节长度，不再解析 JSON
+                raw = await response.read()
+                return RequestResult(
+                    request_id=request_id,
+                    success=True,
+                    status_code=response.status,
+                    response_time=elapsed_time,
+                    response_length=len(raw),
+                    error=None
+                )
             else:
-                error_text = await response.text()
-                return {
-                    "request_id": request_id,
-                    "success": False,
-                    "status_code": response.status,
-                    "response_time": elapsed_time,
-                    "response_length": len(error_text),
-                    "error": f"HTTP {response.status}: {error_text[:100]}"
-                }
+                raw = await response.read()
+                return RequestResult(
+                    request_id=request_id,
+                    success=False,
+                    status_code=response.status,
+                    response_time=elapsed_time,
+                    response_length=len(raw),
+                    error=f"HTTP {response.status}: {raw[:100].decode(errors='replace')}"
+                )
 
     except asyncio.TimeoutError:
-        elapsed_time = time.time() - start_time
-        return {
-            "request_id": request_id,
-            "success": False,
-            "status_code": None,
-            "response_time": elapsed_time,
-            "response_length": 0,
-            "error": "请求超时"
-        }
+        elapsed_time = time.perf_counter() - start_time
+        return RequestResult(
+            request_id=request_id,
+            success=False,
+            status_code=None,
+            response_time=elapsed_time,
+            response_length=0,
+            error="请求超时"
+        )
     except Exception as e:
-        elapsed_time = time.time() - start_time
+        elapsed_time = time.perf_counter() - start_time
+        return RequestResult(
+            request_id=request_id,
+            success=False,
+            status_code=None,
+            response_time=elapsed_time,
+            response_length=0,
+            error=str(e)
+        )
+
+class ResultStats:
+    """边完成边统计请求结果，不保留每个请求的结果
+
+    响应时间的均值/方差用 Welford 算法增量计算；为计算百分位只额外保存成功请求的响应时间（浮点数组）。
+    """
+
+    def __init__(self):
+        self.successful = 0
+        self.failed = 0
+        self.errors: List[str] = []
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min_time = float('inf')
+        self.max_time = 0.0
+        self.response_times = array('d')
+
+    def add(self, result: RequestResult):
+        """记录一个请求结果"""
+        if not result.success:
+            self.failed += 1
+            if result.error:
+                self.errors.append(result.error)
+            return
+
+        response_time = result.response_time
+        self.successful += 1
+        delta = response_time - self.mean
+        self.mean += delta / self.successful
+        self.m2 += delta * (response_time - self.mean)
+        self.min_time = min(self.min_time, response_time)
+        self.max_time = max(self.max_time, response_time)
+        self.response_times.append(response_time)
+
+    def response_time_summary(self) -> Dict:
+        """汇总成功请求的响应时间指标"""
+        if not self.successful:
+            return {
+                "avg_response_time": 0, "stdev_response_time": 0,
+                "min_response_time": 0, "max_response_time": 0,
+                "median_response_time": 0, "p95_response_time": 0, "p99_response_time": 0,
+            }
+
+        # 一次计算全部百分位（P50/P95/P99），样本只有一个时直接取该值
+        if self.successful > 1:
+            percentiles = statistics.quantiles(self.response_times, n=100, method='inclusive')
+            p50, p95, p99 = percentiles[49], percentiles[94], percentiles[98]
+            stdev = (self.m2 / (self.successful - 1)) ** 0.5
+        else:
+            p50 = p95 = p99 = self.mean
+            stdev = 0.0
+
         return {
-            "request_id": request_id,
-            "success": False,
-            "status_code": None,
-            "response_time": elapsed_time,
-            "response_length": 0,
-            "error": str(e)
+            "avg_response_time": self.mean,
+            "stdev_response_time": stdev,
+            "min_response_time": self.min_time,
+            "max_response_time": self.max_time,
+            "median_response_time": p50,
+            "p95_response_time": p95,
+            "p99_response_time": p99,
         }
 
-async def test_concurrent_requests(concurrency: int = 10, total_requests: int = 50) -> Dict:
-    """测试并发请求"""
-    print(f"🚀 测试并发能力: {concurrency} 个并发，总共 {total_requests} 个请求")
+async def warm_up_connections(session: aiohttp.ClientSession, count: int):
+    """并发发出 count 个健康检查请求，让连接池在计时前准备好足够的 keep-alive 连接"""
+    health_url = f"{get_anthropic_proxy_url()}/health"
 
-    url = f"{get_anthropic_proxy_url()}/v1/messages"
+    async def ping():
+        try:
+            async with session.get(health_url) as response:
+                await response.read()
+        except Exception:
+            # 预热失败不影响测试本身，正式请求会自行建立连接
+            pass
 
-    # 创建信号量控制并发数
-    semaphore = asyncio.Semaphore(concurrency)
+    await asyncio.gather(*(ping() for _ in range(count)))
 
-    async def bounded_request(session: aiohttp.ClientSession, request_id: int) -> Dict:
-        async with semaphore:
-            return await single_request(session, request_id, url)
+async def run_worker_pool(request_fn: Callable[[int], Awaitable[RequestResult]], total_requests: int, concurrency: int, stats: ResultStats):
+    """用固定数量的 worker 从队列中取请求编号执行，同一时刻最多只有 concurrency 个请求
 
-    start_time = time.time()
+    request_fn 内部需捕获异常并总是返回 RequestResult，结果完成后立即计入 stats。
+    """
+    queue = asyncio.Queue()
+    for request_id in range(1, total_requests + 1):
+        queue.put_nowait(request_id)
 
-    # 使用 aiohttp 替代 requests 的异步客户端
-    timeout = aiohttp.ClientTimeout(total=120)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        # 创建所有任务
-        tasks = [
-            bounded_request(session, i)
-            for i in range(1, total_requests + 1)
-        ]
+    async def worker():
+        while not queue.empty():
+            request_id = queue.get_nowait()
+            stats.add(await request_fn(request_id))
 
-        print(f"✅ 已创建 {len(tasks)} 个并发任务")
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
 
-        # 执行所有任务
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+async def run_concurrent_requests(session: aiohttp.ClientSession, concurrency: int = 10, total_requests: int = 50) -> Dict:
+    """测试并发请求（由 concurrency 个 worker 控制并发数）
 
-    total_time = time.time() - start_time
+    只做计时和统计，不打印：普通请求和流式请求同时运行时，任何输出都会落入另一方的计时区间。
+    """
+    url = f"{get_anthropic_proxy_url()}/v1/messages"
 
-    # 统计结果
-    successful_requests = [r for r in results if isinstance(r, dict) and r.get('success')]
-    failed_requests = [r for r in results if isinstance(r, dict) and not r.get('success')]
-    exceptions = [r for r in results if not isinstance(r, dict)]
+    start_time = time.perf_counter()
 
-    # 计算性能指标
-    if successful_requests:
-        response_times = [r['response_time'] for r in successful_requests]
-        avg_response_time = statistics.mean(response_times)
-        min_response_time = min(response_times)
-        max_response_time = max(response_times)
-        median_response_time = statistics.median(response_times)
-    else:
-        avg_response_time = min_response_time = max_response_time = median_response_time = 0
+    # 按完成顺序统计结果（single_request 内部已捕获异常，总是返回 RequestResult）
+    stats = ResultStats()
+    await run_worker_pool(
+        lambda request_id: single_request(session, request_id, url),
+        total_requests,
+        concurrency,
+        stats
+    )
 
-    success_rate = len(successful_requests) / total_requests * 100
+    total_time = time.perf_counter() - start_time
+
+    success_rate = stats.successful / total_requests * 100
     requests_per_second = total_requests / total_time if total_time > 0 else 0
 
     return {
         "concurrency": concurrency,
         "total_requests": total_requests,
         "total_time": total_time,
-        "successful": len(successful_requests),
-        "failed": len(failed_requests),
-        "exceptions": len(exceptions),
+        "successful": stats.successful,
+        "failed": stats.failed,
         "success_rate": success_rate,
         "requests_per_second": requests_per_second,
-        "avg_response_time": avg_response_time,
-        "min_response_time": min_response_time,
-        "max_response_time": max_response_time,
-        "median_response_time": median_response_time,
-        "results": results
+        **stats.response_time_summary(),
+        "errors": stats.errors
     }
 
-async def test_streaming_concurrency(concurrency: int = 5, total_requests: int = 20) -> Dict:
-    """测试流式并发请求"""
-    print(f"🌊 测试流式并发: {concurrency} 个并发，总共 {total_requests} 个请求")
-
+async def run_streaming_concurrency(session: aiohttp.ClientSession, concurrency: int = 5, total_requests: int = 20) -> Dict:
+    """测试流式并发请求（由 concurrency 个 worker 控制并发数），与 run_concurrent_requests 一样不打印"""
     url = f"{get_anthropic_proxy_url()}/v1/messages"
 
-    async def stream_request(session: aiohttp.ClientSession, request_id: int) -> Dict:
-        start_time = time.time()
-
-        request_data = {
-            "model": "claude-sonnet-4-5-20250929",
-            "max_tokens": 30,
-            "stream": True,
-            "messages": [
-                {"role": "user", "content": f"流式并发测试 #{request_id}"}
-            ]
-        }
+    async def stream_request(session: aiohttp.ClientSession, request_id: int) -> RequestResult:
+        start_time = time.perf_counter()
 
         try:
             async with session.post(
                 url,
-                json=request_data,
-                headers={
-                    "Content-Type": "application/json",
-                    "x-api-key": "test-key"
-                },
-                timeout=aiohttp.ClientTimeout(total=60)
+                data=STREAM_REQUEST_TEMPLATE % request_id,
+                headers=HEADERS,
+                timeout=REQUEST_TIMEOUT
             ) as response:
 
-                content_chunks = []
-                async for chunk in response.content:
-                    if chunk:
-                        content_chunks.append(chunk)
-
-                elapsed_time = time.time() - start_time
-                total_content = b''.join(content_chunks)
-
-                return {
-                    "request_id": request_id,
-                    "success": response.status == 200,
-                    "status_code": response.status,
-                    "response_time": elapsed_time,
-                    "chunks_received": len(content_chunks),
-                    "content_length": len(total_content),
-                    "error": None
-                }
+                if response.status != 200:
+                    raw = await response.read()
+                    return RequestResult(
+                        request_id=request_id,
+                        success=False,
+                        status_code=response.status,
+                        response_time=time.perf_counter() - start_time,
+                        response_length=len(raw),
+                        error=f"HTTP {response.status}: {raw[:200].decode(errors='replace')}"
+                    )
+
+                # 只统计块数和字节数，不保存响应内容
+                chunks_received = 0
+                content_length = 0
+                async for chunk in response.content.iter_any():
+                    chunks_received += 1
+                    content_length += len(chunk)
+
+                elapsed_time = time.perf_counter() - start_time
+
+                return RequestResult(
+                    request_id=request_id,
+                    success=True,
+                    status_code=response.status,
+                    response_time=elapsed_time,
+                    response_length=content_length,
+                    error=None,
+                    chunks_received=chunks_received
+                )
 
         except Exception as e:
-            elapsed_time = time.time() - start_time
-            return {
-                "request_id": request_id,
-                "success": False,
-                "status_code": None,
-                "response_time": elapsed_time,
-                "chunks_received": 0,
-                "content_length": 0,
-                "error": str(e)
-            }
-
-    semaphore = asyncio.Semaphore(concurrency)
-
-    async def bounded_stream_request(session: aiohttp.ClientSession, request_id: int) -> Dict:
-        async with semaphore:
-            return await stream_request(session, request_id)
-
-    start_time = time.time()
-
-    timeout = aiohttp.ClientTimeout(total=120)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        tasks = [
-            bounded_stream_request(session, i)
-            for i in range(1, total_requests + 1)
-        ]
+            elapsed_time = time.perf_counter() - start_time
+            return RequestResult(
+                request_id=request_id,
+                success=False,
+                status_code=None,
+                response_time=elapsed_time,
+                response_length=0,
+                error=str(e),
+                chunks_received=0
+            )
 
-        print(f"✅ 已创建 {len(tasks)} 个流式任务")
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+    start_time = time.perf_counter()
 
-    total_time = time.time() - start_time
+    # 按完成顺序统计结果（stream_request 内部已捕获异常，总是返回 RequestResult）
+    stats = ResultStats()
+    await run_worker_pool(
+        lambda request_id: stream_request(session, request_id),
+        total_requests,
+        concurrency,
+        stats
+    )
 
-    successful_requests = [r for r in results if isinstance(r, dict) and r.get('success')]
-    failed_requests = [r for r in results if isinstance(r, dict) and not r.get('success')]
+    total_time = time.perf_counter() - start_time
 
-    success_rate = len(successful_requests) / total_requests * 100
+    success_rate = stats.successful / total_requests * 100
     requests_per_second = total_requests / total_time if total_time > 0 else 0
 
     return {
         "concurrency": concurrency,
         "total_requests": total_requests,
         "total_time": total_time,
-        "successful": len(successful_requests),
-        "failed": len(failed_requests),
+        "successful": stats.successful,
+        "failed": stats.failed,
         "success_rate": success_rate,
         "requests_per_second": requests_per_second,
-        "results": results
+        "errors": stats.errors
     }
 
-async def main():
-    """主函数"""
-    print("=" * 80)
-    print("🧪 代理服务器并发处理能力测试")
-    print("=" * 80)
-    print(f"🔗 测试地址: {get_anthropic_proxy_url()}")
-    print("=" * 80)
+async def test_concurrent_requests(session: aiohttp.ClientSession):
+    """pytest 入口：默认规模的普通并发请求应全部成功"""
+    result = await run_concurrent_requests(session)
+    assert result['successful'] == result['total_requests'], f"普通并发请求失败: {result['errors'][:3]}"
 
-    # 首先检查服务器是否运行
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{get_anthropic_proxy_url()}/health", timeout=5) as response:
-                if response.status != 200:
-                    print("❌ 代理服务器未正常运行")
-                    return
-    except Exception as e:
-        print(f"❌ 无法连接到代理服务器: {e}")
-        print("💡 请确保代理服务器正在运行: python anthropic_proxy.py")
-        return
-
-    print("✅ 代理服务器运行正常\n")
-
-    # 测试场景
-    test_scenarios = [
-        {"concurrency": 1, "total": 5, "name": "基准测试"},
-        {"concurrency": 5, "total": 20, "name": "轻度并发"},
-        {"concurrency": 10, "total": 50, "name": "中度并发"},
-        {"concurrency": 20, "total": 100, "name": "高度并发"},
-    ]
+async def test_streaming_concurrency(session: aiohttp.ClientSession):
+    """pytest 入口：默认规模的流式并发请求应全部成功"""
+    result = await run_streaming_concurrency(session)
+    assert result['successful'] == result['total_requests'], f"流式并发请求失败: {result['errors'][:3]}"
+
+async def run_scenarios(session: aiohttp.ClientSession):
+    """依次运行各并发场景并输出总结"""
 
     all_results = []
 
-    for scenario in test_scenarios:
+    for scenario in TEST_SCENARIOS:
         print(f"\n{'='*30} {scenario['name']} {'='*30}")
 
+        concurrency = scenario['concurrency']
+        normal_total = scenario['total']
+        stream_total = min(scenario['total'], 20)
+        run_stream = concurrency <= 10  # 流式测试降低并发
+        load_label = "（混合负载）" if run_stream else ""
+
+        if run_stream:
+            print(f"🚀 测试并发能力: 普通 {concurrency} 个并发 {normal_total} 个请求 + 流式 {concurrency} 个并发 {stream_total} 个请求")
+            print("📝 两类请求同时运行，以下结果均为混合负载下的测量值")
+        else:
+            print(f"🚀 测试并发能力: {concurrency} 个并发，总共 {normal_total} 个请求")
+
+        # 计时前一次性预热本场景所需的连接，首批请求不再承担建立连接的开销
+        worker_count = concurrency * 2 if run_stream else concurrency
+        await warm_up_connections(session, worker_count)
+
+        # 输出放在计时开始之前，计时区间内不做任何打印
+        print(f"✅ 启动 {worker_count} 个 worker")
+
+        # 并发数由 worker 数控制；普通请求和流式请求互不依赖，共用同一会话同时执行
+        if run_stream:
+            result, stream_result = await asyncio.gather(
+                run_concurrent_requests(session, concurrency=concurrency, total_requests=normal_total),
+                run_streaming_concurrency(session, concurrency=concurrency, total_requests=stream_total)
+            )
+        else:
+            result = await run_concurrent_requests(session, concurrency=concurrency, total_requests=normal_total)
+
         # 测试普通请求
-        result = await test_concurrent_requests(
-            concurrency=scenario['concurrency'],
-            total_requests=scenario['total']
-        )
         result['test_type'] = 'normal'
         result['scenario_name'] = scenario['name']
         all_results.append(result)
 
-        print(f"📊 普通请求结果:")
+        print(f"📊 普通请求结果{load_label}:")
         print(f"   成功率: {result['success_rate']:.1f}% ({result['successful']}/{result['total_requests']})")
         print(f"   QPS: {result['requests_per_second']:.2f}")
-        print(f"   平均响应时间: {result['avg_response_time']:.2f}s")
+        print(f"   平均响应时间: {result['avg_response_time']:.2f}s (标准差 {result['stdev_response_time']:.2f}s)")
         print(f"   响应时间范围: {result['min_response_time']:.2f}s - {result['max_response_time']:.2f}s")
+        print(f"   P50/P95/P99: {result['median_response_time']:.2f}s / {result['p95_response_time']:.2f}s / {result['p99_response_time']:.2f}s")
 
         # 测试流式请求
-        if scenario['concurrency'] <= 10:  # 流式测试降低并发
-            stream_result = await test_streaming_concurrency(
-                concurrency=scenario['concurrency'],
-                total_requests=min(scenario['total'], 20)
-            )
+        if run_stream:
             stream_result['test_type'] = 'stream'
             stream_result['scenario_name'] = scenario['name']
             all_results.append(stream_result)
 
-            print(f"📊 流式请求结果:")
+            print(f"📊 流式请求结果{load_label}:")
             print(f"   成功率: {stream_result['success_rate']:.1f}% ({stream_result['successful']}/{stream_result['total_requests']})")
             print(f"   QPS: {stream_result['requests_per_second']:.2f}")
 
     # 总结
     print(f"\n{'='*80}")
-    print("📋 并发处理能力总结")
+    print("📋 并发处理能力总结（流式测试场景中为普通与流式请求混合负载）")
     print(f"{'='*80}")
 
     normal_results = [r for r in all_results if r['test_type'] == 'normal']
@@ -351,5 +474,38 @@ async def main():
     print("   4. 监控资源使用情况，必要时增加超时配置")
     print("   5. 考虑添加请求限流机制防止过载")
 
+async def main():
+    """主函数"""
+    print("=" * 80)
+    print("🧪 代理服务器并发处理能力测试")
+    print("=" * 80)
+    print(f"🔗 测试地址: {get_anthropic_proxy_url()}")
+    print("=" * 80)
+
+    # 健康检查和所有场景共用一个会话，keep-alive 连接在场景之间复用；
+    # 连接池上限为最大场景并发数的两倍（普通请求和流式请求同时执行）
+    max_concurrency = max(scenario["concurrency"] for scenario in TEST_SCENARIOS)
+    async with create_session(limit=max_concurrency * 2) as session:
+        # 首先检查服务器是否运行
+        try:
+            async with session.get(f"{get_anthropic_proxy_url()}/health", timeout=HEALTH_CHECK_TIMEOUT) as response:
+                if response.status != 200:
+                    print("❌ 代理服务器未正常运行")
+                    return
+        except Exception as e:
+            print(f"❌ 无法连接到代理服务器: {e}")
+            print("💡 请确保代理服务器正在运行: python anthropic_proxy.py")
+            return
+
+        print("✅ 代理服务器运行正常\n")
+
+        await run_scenarios(session)
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    # 优先使用 uvloop 事件循环（降低大量并发任务的调度开销），不可用时回退到默认循环
+    try:
+        import uvloop
+        loop_factory = uvloop.new_event_loop
+    except ImportError:
+        loop_factory = None
+    asyncio.run(main(), loop_factory=loop_factory)
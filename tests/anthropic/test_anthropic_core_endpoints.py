@@ -18,8 +18,9 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(project_root))
 
-import requests
-import time
+import asyncio
+import aiohttp
+import orjson
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -31,70 +32,43 @@ def get_anthropic_proxy_url():
     port = os.getenv('PROXY_PORT', '8080')
     return f"http://{host}:{port}"
 
-def test_health_endpoint():
+async def test_health_endpoint(session):
     """测试健康检查端点"""
     print("🏥 测试 /health 端点...")
-    try:
-        base_url = get_anthropic_proxy_url()
-        response = requests.get(f"{base_url}/health")
-        if response.status_code == 200:
-            data = response.json()
-            print(f"✅ /health 端点正常: {data}")
-            return True
-        else:
-            print(f"❌ /health 端点失败: {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"❌ /health 端点异常: {e}")
-        print(f"💡 请确保代理服务器正在运行: python anthropic_proxy.py")
-        return False
-
-def test_models_endpoint():
+    base_url = get_anthropic_proxy_url()
+    async with session.get(f"{base_url}/health") as response:
+        assert response.status == 200, f"/health 端点失败: {response.status}"
+        data = orjson.loads(await response.read())
+    assert data.get('status') == 'healthy', f"/health 返回异常状态: {data}"
+    print(f"✅ /health 端点正常: {data}")
+
+async def test_models_endpoint(session):
     """测试 models 端点"""
     print("\n🤖 测试 /v1/models 端点...")
-    try:
-        base_url = get_anthropic_proxy_url()
-        response = requests.get(f"{base_url}/v1/models")
-        if response.status_code == 200:
-            data = response.json()
-            if 'data' in data and isinstance(data['data'], list):
-                print(f"✅ /v1/models 端点正常，返回 {len(data['data'])} 个模型")
-                # 显示前几个模型
-                for i, model in enumerate(data['data'][:3]):
-                    print(f"   - {model.get('id', 'Unknown')}")
-                return True
-            else:
-                print(f"❌ /v1/models 返回格式错误: {data}")
-                return False
-        else:
-            print(f"❌ /v1/models 端点失败: {response.status_code} - {response.text}")
-            return False
-    except Exception as e:
-        print(f"❌ /v1/models 端点异常: {e}")
-        print(f"💡 请确保代理服务器正在运行: python anthropic_proxy.py")
-        return False
-
-def test_service_info():
+    base_url = get_anthropic_proxy_url()
+    async with session.get(f"{base_url}/v1/models") as response:
+        body = await response.read()
+    assert response.status == 200, f"/v1/models 端点失败: {response.status} - {body.decode(errors='replace')}"
+    data = orjson.loads(body)
+    assert isinstance(data.get('data'), list), f"/v1/models 返回格式错误: {data}"
+    print(f"✅ /v1/models 端点正常，返回 {len(data['data'])} 个模型")
+    # 显示前几个模型
+    for i, model in enumerate(data['data'][:3]):
+        print(f"   - {model.get('id', 'Unknown')}")
+
+async def test_service_info(session):
     """测试服务信息端点"""
     print("\n📋 测试服务信息端点...")
-    try:
-        base_url = get_anthropic_proxy_url()
-        response = requests.get(f"{base_url}/")
-        if response.status_code == 200:
-            data = response.json()
-            print(f"✅ 服务信息正常: {data.get('service')} - {data.get('status')}")
-            print(f"   可用端点: {list(data.get('endpoints', {}).keys())}")
-            return True
-        else:
-            print(f"❌ 服务信息端点失败: {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"❌ 服务信息端点异常: {e}")
-        print(f"💡 请确保代理服务器正在运行: python anthropic_proxy.py")
-        return False
-
-def main():
-    """运行核心功能测试"""
+    base_url = get_anthropic_proxy_url()
+    async with session.get(f"{base_url}/") as response:
+        assert response.status == 200, f"服务信息端点失败: {response.status}"
+        data = orjson.loads(await response.read())
+    assert 'service' in data and 'endpoints' in data, f"服务信息返回格式错误: {data}"
+    print(f"✅ 服务信息正常: {data.get('service')} - {data.get('status')}")
+    print(f"   可用端点: {list(data['endpoints'].keys())}")
+
+async def main():
+    """运行核心功能测试（各端点相互独立，并发执行）"""
     print("🧪 Claude Proxy 核心功能测试")
     print("=" * 50)
     print(f"🔗 测试地址: {get_anthropic_proxy_url()}")
@@ -106,13 +80,17 @@ def main():
         test_service_info,
     ]
 
-    passed = 0
-    total = len(tests)
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
+        # 测试通过 assert 判定失败，这里收集异常以便汇总所有端点的结果
+        results = await asyncio.gather(*(test(session) for test in tests), return_exceptions=True)
 
-    for test in tests:
-        if test():
+    passed = 0
+    for test, result in zip(tests, results):
+        if isinstance(result, BaseException):
+            print(f"❌ {test.__name__} 失败: {result}")
+        else:
             passed += 1
-        time.sleep(0.5)  # 短暂间隔
+    total = len(tests)
 
     print("\n" + "=" * 50)
     print(f"📊 测试结果: {passed}/{total} 通过")
@@ -130,4 +108,4 @@ def main():
         return False
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,23 @@
+"""
+pytest 共享配置
+
+整个测试会话共用一个事件循环和一个 aiohttp 会话（连接池），避免每个测试重建
+"""
+
+import aiohttp
+import pytest_asyncio
+
+
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def session():
+    """会话级共享的 aiohttp 会话，所有测试复用同一个连接池和 keep-alive 连接"""
+    connector = aiohttp.TCPConnector(
+        limit=200,
+        limit_per_host=200,
+        ttl_dns_cache=300,
+        enable_cleanup_closed=True,
+        keepalive_timeout=75,
+    )
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=120)) as session:
+        yield session
+
@@ -11,15 +11,101 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(project_root))
 
-import requests
-import json
+import asyncio
+import httpx
+import orjson
 from dotenv import load_dotenv
 
 # 加载环境变量
 load_dotenv()
 
-def test_openrouter_connectivity():
-    """测试 OpenRouter API 基本连通性"""
+async def _check_models_list(client, api_url, headers):
+    """测试1：健康检查 - 获取模型列表"""
+    print(f"\n🏥 测试1: 获取模型列表")
+    models_url = f"{api_url}/models"
+
+    print(f"📤 GET {models_url}")
+    response = await client.get(models_url, headers=headers, timeout=10)
+    body = response.content
+
+    print(f"📊 状态码: {response.status_code} ({response.http_version})")
+    print(f"📋 响应头: {dict(response.headers)}")
+
+    # 打印原始响应内容用于调试
+    text = body.decode(errors='replace')
+    print(f"📄 原始响应内容 (前200字符): {text[:200]}")
+
+    assert response.status_code == 200, f"模型列表获取失败: {response.status_code} - {text}"
+    data = orjson.loads(body)
+    assert isinstance(data.get('data'), list), f"模型列表返回格式错误: {text[:200]}"
+    print(f"✅ 模型列表获取成功，共 {len(data['data'])} 个模型")
+
+    # 查找目标模型
+    target_model = "anthropic/claude-sonnet-4.5"
+    found_models = [m for m in data['data'] if target_model in m.get('id', '')]
+    if found_models:
+        print(f"✅ 找到目标模型: {target_model}")
+    else:
+        print(f"⚠️  未找到目标模型: {target_model}")
+        print("💡 可用模型示例:")
+        for i, model in enumerate(data['data'][:3]):
+            print(f"   - {model.get('id', 'Unknown')}")
+
+async def _check_chat_completion(client, api_url, headers):
+    """测试2：简单聊天请求"""
+    print(f"\n💬 测试2: 简单聊天请求")
+    chat_url = f"{api_url}/chat/completions"
+
+    payload = {
+        "model": "anthropic/claude-sonnet-4.5",
+        "messages": [
+            {"role": "user", "content": "Hello, please just say 'Hi there!' and nothing else."}
+        ],
+        "max_tokens": 10,
+        "temperature": 0.1
+    }
+
+    print(f"📤 POST {chat_url}")
+    print(f"📝 模型: {payload['model']}")
+    print(f"📝 消息: {payload['messages'][0]['content']}")
+    print(f"📝 最大tokens: {payload['max_tokens']}")
+
+    response = await client.post(chat_url, headers=headers, content=orjson.dumps(payload), timeout=30)
+    body = response.content
+
+    print(f"📊 状态码: {response.status_code} ({response.http_version})")
+    print(f"📋 响应头: {dict(response.headers)}")
+
+    if response.status_code != 200:
+        # 分析常见错误
+        if response.status_code == 401:
+            print("💡 401 错误: API Key 可能无效或已过期")
+        elif response.status_code == 403:
+            print("💡 403 错误: 权限不足或账户问题")
+        elif response.status_code == 429:
+            print("💡 429 错误: 请求频率限制")
+        elif response.status_code >= 500:
+            print("💡 5xx 错误: OpenRouter 服务器问题")
+    assert response.status_code == 200, f"聊天请求失败: {response.status_code} - {body.decode(errors='replace')}"
+
+    data = orjson.loads(body)
+    assert data.get('choices'), f"聊天响应缺少 choices: {data}"
+    print("✅ 聊天请求成功!")
+
+    choice = data['choices'][0]
+    if 'message' in choice:
+        content = choice['message'].get('content', '')
+        print(f"📝 回复: '{content}'")
+
+    if 'usage' in data:
+        usage = data['usage']
+        print(f"📊 Token使用: {usage}")
+
+    if 'finish_reason' in choice:
+        print(f"🏁 完成原因: {choice['finish_reason']}")
+
+async def test_openrouter_connectivity():
+    """测试 OpenRouter API 基本连通性（模型列表与聊天请求相互独立，并发执行）"""
     print("🧪 OpenRouter API 连通性测试")
     print("=" * 60)
 
@@ -31,126 +117,23 @@ def test_openrouter_connectivity():
     api_url = base_url + '/v1' if not base_url.endswith('/v1') else base_url
 
     print(f"📋 API URL: {api_url}")
-    print(f"🔑 API Key: {api_key[:20]}...{api_key[-10:] if api_key and len(api_key) > 30 else 'None'}")
+    print(f"🔑 API Key: {api_key[:20] if api_key else ''}...{api_key[-10:] if api_key and len(api_key) > 30 else 'None'}")
     print(f"📏 Key Length: {len(api_key) if api_key else 0}")
 
-    if not api_key:
-        print("❌ OPENROUTER_API_KEY 未设置")
-        return False
+    assert api_key, "OPENROUTER_API_KEY 未设置"
 
-    # 测试1：健康检查 - 获取模型列表
-    print(f"\n🏥 测试1: 获取模型列表")
-    try:
-        models_url = f"{api_url}/models"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-
-        print(f"📤 GET {models_url}")
-        response = requests.get(models_url, headers=headers, timeout=10)
-
-        print(f"📊 状态码: {response.status_code}")
-        print(f"📋 响应头: {dict(response.headers)}")
-
-        # 打印原始响应内容用于调试
-        print(f"📄 原始响应内容 (前200字符): {response.text[:200]}")
-
-        if response.status_code == 200:
-            try:
-                data = response.json()
-                model_count = len(data.get('data', []))
-                print(f"✅ 模型列表获取成功，共 {model_count} 个模型")
-            except json.JSONDecodeError as e:
-                print(f"❌ JSON 解析失败: {e}")
-                print(f"完整响应: {response.text}")
-                return False
-
-            # 查找目标模型
-            target_model = "anthropic/claude-sonnet-4.5"
-            found_models = [m for m in data.get('data', []) if target_model in m.get('id', '')]
-            if found_models:
-                print(f"✅ 找到目标模型: {target_model}")
-            else:
-                print(f"⚠️  未找到目标模型: {target_model}")
-                print("💡 可用模型示例:")
-                for i, model in enumerate(data.get('data', [])[:3]):
-                    print(f"   - {model.get('id', 'Unknown')}")
-
-        else:
-            print(f"❌ 模型列表获取失败: {response.text}")
-            return False
-
-    except Exception as e:
-        print(f"❌ 模型列表请求异常: {e}")
-        return False
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
 
-    # 测试2：简单聊天请求
-    print(f"\n💬 测试2: 简单聊天请求")
-    try:
-        chat_url = f"{api_url}/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-
-        payload = {
-            "model": "anthropic/claude-sonnet-4.5",
-            "messages": [
-                {"role": "user", "content": "Hello, please just say 'Hi there!' and nothing else."}
-            ],
-            "max_tokens": 10,
-            "temperature": 0.1
-        }
-
-        print(f"📤 POST {chat_url}")
-        print(f"📝 模型: {payload['model']}")
-        print(f"📝 消息: {payload['messages'][0]['content']}")
-        print(f"📝 最大tokens: {payload['max_tokens']}")
-
-        response = requests.post(chat_url, headers=headers, json=payload, timeout=30)
-
-        print(f"📊 状态码: {response.status_code}")
-        print(f"📋 响应头: {dict(response.headers)}")
-
-        if response.status_code == 200:
-            data = response.json()
-            print("✅ 聊天请求成功!")
-
-            if 'choices' in data and len(data['choices']) > 0:
-                choice = data['choices'][0]
-                if 'message' in choice:
-                    content = choice['message'].get('content', '')
-                    print(f"📝 回复: '{content}'")
-
-                if 'usage' in data:
-                    usage = data['usage']
-                    print(f"📊 Token使用: {usage}")
-
-                if 'finish_reason' in choice:
-                    print(f"🏁 完成原因: {choice['finish_reason']}")
-
-            return True
-        else:
-            print(f"❌ 聊天请求失败")
-            print(f"状态码: {response.status_code}")
-            print(f"错误响应: {response.text}")
-
-            # 分析常见错误
-            if response.status_code == 401:
-                print("💡 401 错误: API Key 可能无效或已过期")
-            elif response.status_code == 403:
-                print("💡 403 错误: 权限不足或账户问题")
-            elif response.status_code == 429:
-                print("💡 429 错误: 请求频率限制")
-            elif response.status_code >= 500:
-                print("💡 5xx 错误: OpenRouter 服务器问题")
-
-            return False
-
-    except Exception as e:
-        print(f"❌ 聊天请求异常: {e}")
-        return False
+    # HTTP/2 下两个请求复用同一个 TLS 连接多路传输，只需一次握手
+    limits = httpx.Limits(max_connections=10, max_keepalive_connections=10)
+    async with httpx.AsyncClient(http2=True, limits=limits, timeout=10) as client:
+        await asyncio.gather(
+            _check_models_list(client, api_url, headers),
+            _check_chat_completion(client, api_url, headers),
+        )
 
 def show_next_steps(success):
     """显示后续步骤"""
@@ -176,7 +159,12 @@ def show_next_steps(success):
     print("=" * 60)
 
 if __name__ == "__main__":
-    success = test_openrouter_connectivity()
+    try:
+        asyncio.run(test_openrouter_connectivity())
+        success = True
+    except Exception as e:
+        print(f"❌ {e}")
+        success = False
     show_next_steps(success)
 
     exit(0 if success else 1)
\ No newline at end of file
@@ -11,239 +11,377 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(project_root))
 
+import argparse
 import asyncio
+import functools
+import hashlib
+import shelve
 import aiohttp
+import math
 import time
-import json
-from typing import List, Dict
-import statistics
+import orjson
+from dataclasses import dataclass
+from typing import Dict, Optional
 from dotenv import load_dotenv
 
 # 加载环境变量
 load_dotenv()
 
+# 所有请求共用的请求头
+HEADERS = {
+    "Content-Type": "application/json",
+    "Authorization": "Bearer test-key"
+}
+
+# 请求体模板只用 orjson 序列化一次，每个请求只需用 % 填入请求编号（% 格式化对字节串同样适用）
+REQUEST_TEMPLATE = orjson.dumps({
+    "model": "anthropic/claude-4.5-sonnet",
+    "max_tokens": 20,
+    "messages": [
+        {"role": "user", "content": "并发测试请求 #%d，请简短回复"}
+    ]
+})
+
+STREAM_REQUEST_TEMPLATE = orjson.dumps({
+    "model": "anthropic/claude-4.5-sonnet",
+    "max_tokens": 50,
+    "stream": True,
+    "messages": [
+        {"role": "user", "content": "流式并发测试 #%d，请简短回复"}
+    ]
+})
+
+# 启动前健康检查的超时（aiohttp 的 timeout 参数应传 ClientTimeout 而不是数字）
+HEALTH_CHECK_TIMEOUT = aiohttp.ClientTimeout(total=5)
+
+# 测试场景
+TEST_SCENARIOS = [
+    {"concurrency": 1, "total": 5, "name": "基准测试"},
+    {"concurrency": 5, "total": 20, "name": "轻度并发"},
+    {"concurrency": 10, "total": 50, "name": "中度并发"},
+    {"concurrency": 20, "total": 100, "name": "高度并发"},
+]
+
+@dataclass(slots=True)
+class ReqResult:
+    """单个请求的结果"""
+    request_id: int
+    status_code: Optional[int]
+    response_time: float
+    success: bool
+    response_text: Optional[str]
+    error: Optional[str]
+
+# --replay 开发模式：按请求体缓存成功的请求结果到磁盘，重复运行时直接回放，不再发出真实请求
+REPLAY_CACHE_PATH = str(project_root / ".bench_cache")
+REPLAY_TTL = 24 * 3600
+_replay_cache: Optional[shelve.Shelf] = None
+
+def _replay_key(payload: bytes) -> str:
+    return hashlib.blake2b(payload).hexdigest()
+
+def _replay_get(payload: bytes) -> Optional[ReqResult]:
+    """回放模式下返回未过期的缓存结果"""
+    if _replay_cache is None:
+        return None
+    entry = _replay_cache.get(_replay_key(payload))
+    if entry is None:
+        return None
+    stored_at, result = entry
+    if time.time() - stored_at > REPLAY_TTL:
+        return None
+    return result
+
+def _replay_put(payload: bytes, result: ReqResult):
+    """回放模式下缓存成功的请求结果"""
+    if _replay_cache is not None and result.success:
+        _replay_cache[_replay_key(payload)] = (time.time(), result)
+
+@functools.lru_cache(maxsize=1)
 def get_openrouter_proxy_url():
-    """获取OpenRouter代理服务器URL"""
+    """获取OpenRouter代理服务器URL（环境变量在运行期间不变，只读取一次）"""
     host = os.getenv('OPENAI_PROXY_HOST', 'localhost')
     port = os.getenv('OPENAI_PROXY_PORT', '9998')
     return f"http://{host}:{port}"
 
-async def single_request(session: aiohttp.ClientSession, request_id: int, url: str) -> Dict:
+async def single_request(session: aiohttp.ClientSession, request_id: int, url: str) -> ReqResult:
     """发送单个请求"""
-    start_time = time.time()
-
-    request_data = {
-        "model": "anthropic/claude-4.5-sonnet",
-        "max_tokens": 20,
-        "messages": [
-            {"role": "user", "content": f"并发测试请求 #{request_id}，请简短回复"}
-        ]
-    }
+    payload = REQUEST_TEMPLATE % request_id
+    cached = _replay_get(payload)
+    if cached is not None:
+        return cached
+
+    start_time = time.perf_counter()
 
     try:
         async with session.post(
             url,
-            json=request_data,
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": "Bearer test-key"
-            }
+            data=payload,
+            headers=HEADERS
         ) as response:
-            response_time = time.time() - start_time
-
-            # 读取响应
-            response_text = await response.text()
-
-            return {
-                "request_id": request_id,
-                "status_code": response.status,
-                "response_time": response_time,
-                "success": response.status == 200,
-                "response_text": response_text[:100] + "..." if len(response_text) > 100 else response_text,
-                "error": None
-            }
+            response_time = time.perf_counter() - start_time
+
+            # 读完响应体（读完才能把连接放回连接池复用），但只解码前 128 字节作为预览
+            body = await response.read()
+            response_text = body[:128].decode('utf-8', errors='ignore')
+
+            result = ReqResult(
+                request_id=request_id,
+                status_code=response.status,
+                response_time=response_time,
+                success=response.status == 200,
+                response_text=response_text,
+                error=None
+            )
+            _replay_put(payload, result)
+            return result
 
     except Exception as e:
-        return {
-            "request_id": request_id,
-            "status_code": None,
-            "response_time": time.time() - start_time,
-            "success": False,
-            "response_text": None,
-            "error": str(e)
-        }
-
-async def single_stream_request(session: aiohttp.ClientSession, request_id: int, url: str) -> Dict:
+        return ReqResult(
+            request_id=request_id,
+            status_code=None,
+            response_time=time.perf_counter() - start_time,
+            success=False,
+            response_text=None,
+            error=str(e)
+        )
+
+async def single_stream_request(session: aiohttp.ClientSession, request_id: int, url: str) -> ReqResult:
     """发送单个流式请求"""
-    start_time = time.time()
-
-    request_data = {
-        "model": "anthropic/claude-4.5-sonnet",
-        "max_tokens": 50,
-        "stream": True,
-        "messages": [
-            {"role": "user", "content": f"流式并发测试 #{request_id}，请简短回复"}
-        ]
-    }
+    payload = STREAM_REQUEST_TEMPLATE % request_id
+    cached = _replay_get(payload)
+    if cached is not None:
+        return cached
+
+    start_time = time.perf_counter()
 
     try:
         async with session.post(
             url,
-            json=request_data,
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": "Bearer test-key"
-            }
+            data=payload,
+            headers=HEADERS
         ) as response:
-            response_time = time.time() - start_time
-
-            # 读取流式响应
-            chunks = []
-            async for chunk in response.content:
-                if chunk:
-                    chunks.append(chunk.decode('utf-8', errors='ignore'))
-
-            full_response = ''.join(chunks)
-
-            return {
-                "request_id": request_id,
-                "status_code": response.status,
-                "response_time": response_time,
-                "success": response.status == 200,
-                "response_text": full_response[:200] + "..." if len(full_response) > 200 else full_response,
-                "error": None
-            }
+            response_time = time.perf_counter() - start_time
+
+            # 读完整个流（测量完整流式耗时并让连接可复用），只在 bytearray 中保留前 256 字节作为预览，
+            # 最后一次性解码，避免逐块解码和拼接整个响应
+            preview = bytearray()
+            async for chunk in response.content.iter_any():
+                if len(preview) < 256:
+                    preview += chunk[:256 - len(preview)]
+
+            result = ReqResult(
+                request_id=request_id,
+                status_code=response.status,
+                response_time=response_time,
+                success=response.status == 200,
+                response_text=preview.decode('utf-8', errors='ignore'),
+                error=None
+            )
+            _replay_put(payload, result)
+            return result
 
     except Exception as e:
-        return {
-            "request_id": request_id,
-            "status_code": None,
-            "response_time": time.time() - start_time,
-            "success": False,
-            "response_text": None,
-            "error": str(e)
-        }
-
-async def run_concurrency_test(concurrency: int, total_requests: int, is_stream: bool = False) -> Dict:
-    """运行并发测试"""
-    print(f"\n🚀 测试并发能力: {concurrency} 个并发，总共 {total_requests} 个请求")
-    print(f"📝 请求类型: {'流式' if is_stream else '非流式'}")
-
-    url = f"{get_openrouter_proxy_url()}/v1/chat/completions"
-
-    # 创建信号量限制并发数
-    semaphore = asyncio.Semaphore(concurrency)
-
-    async def limited_request(session, request_id):
-        async with semaphore:
-            if is_stream:
-                return await single_stream_request(session, request_id, url)
-            else:
-                return await single_request(session, request_id, url)
-
-    start_time = time.time()
-
-    async with aiohttp.ClientSession() as session:
-        # 创建所有任务
-        tasks = [limited_request(session, i) for i in range(1, total_requests + 1)]
+        return ReqResult(
+            request_id=request_id,
+            status_code=None,
+            response_time=time.perf_counter() - start_time,
+            success=False,
+            response_text=None,
+            error=str(e)
+        )
 
-        print(f"✅ 已创建 {len(tasks)} 个{'流式' if is_stream else ''}任务")
+async def warm_up_connections(session: aiohttp.ClientSession, count: int):
+    """并发发出 count 个健康检查请求，让连接池在计时前准备好足够的 keep-alive 连接"""
+    health_url = f"{get_openrouter_proxy_url()}/health"
 
-        # 等待所有任务完成
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+    async def ping():
+        try:
+            async with session.get(health_url) as response:
+                await response.read()
+        except Exception:
+            # 预热失败不影响测试本身，正式请求会自行建立连接
+            pass
 
-    total_time = time.time() - start_time
+    await asyncio.gather(*(ping() for _ in range(count)))
 
-    # 统计结果
-    successful_requests = [r for r in results if isinstance(r, dict) and r.get('success', False)]
-    failed_requests = [r for r in results if isinstance(r, dict) and not r.get('success', False)]
+async def run_concurrency_test(session: aiohttp.ClientSession, concurrency: int, total_requests: int, is_stream: bool = False) -> Dict:
+    """运行并发测试（所有场景共用同一个会话及其连接池）
 
-    # 计算响应时间统计
-    response_times = [r['response_time'] for r in successful_requests if 'response_time' in r]
+    只做计时和统计，不打印也不预热：普通请求和流式请求同时运行，
+    任何一方的输出或预热都会落入另一方的计时区间。
+    """
+    url = f"{get_openrouter_proxy_url()}/v1/chat/completions"
 
-    avg_response_time = statistics.mean(response_times) if response_times else 0
-    min_response_time = min(response_times) if response_times else 0
-    max_response_time = max(response_times) if response_times else 0
+    request_fn = single_stream_request if is_stream else single_request
+
+    # 固定 concurrency 个 worker 从队列中取请求编号执行：同一时刻最多只有 concurrency 个请求协程，
+    # 不再为每个请求预先创建协程再用信号量阻塞
+    queue = asyncio.Queue()
+    for request_id in range(1, total_requests + 1):
+        queue.put_nowait(request_id)
+
+    # 每个请求完成时立即累计成功/失败数和响应时间（求和、最小、最大），不保留每个请求的结果
+    successful = failed = 0
+    first_error = None
+    total_response_time = 0.0
+    min_response_time = math.inf
+    max_response_time = 0.0
+
+    def record(result: ReqResult):
+        nonlocal successful, failed, first_error, total_response_time, min_response_time, max_response_time
+
+        # 请求协程内部已捕获异常，总是返回 ReqResult，这里直接按 success 分类
+        if result.success:
+            successful += 1
+            response_time = result.response_time
+            total_response_time += response_time
+            if response_time < min_response_time:
+                min_response_time = response_time
+            if response_time > max_response_time:
+                max_response_time = response_time
+        else:
+            failed += 1
+            if first_error is None:
+                first_error = result.error or 'Unknown'
+
+    async def worker():
+        while not queue.empty():
+            request_id = queue.get_nowait()
+            record(await request_fn(session, request_id, url))
+
+    start_time = time.perf_counter()
+
+    # 请求协程已在内部把请求异常转换为失败结果，worker 抛出的异常只可能是脚本本身的错误：
+    # 用 TaskGroup 让它直接传播，并取消其余 worker，而不是留下仍在运行的孤立任务
+    async with asyncio.TaskGroup() as task_group:
+        for _ in range(concurrency):
+            task_group.create_task(worker())
+
+    total_time = time.perf_counter() - start_time
+
+    avg_response_time = total_response_time / successful if successful else 0
+    if not successful:
+        min_response_time = 0
 
     # 计算QPS
     requests_per_second = total_requests / total_time if total_time > 0 else 0
 
-    success_rate = len(successful_requests) / total_requests * 100 if total_requests > 0 else 0
-
-    # 打印结果
-    print(f"📊 {'流式' if is_stream else ''}请求结果:")
-    print(f"   成功率: {success_rate:.1f}% ({len(successful_requests)}/{total_requests})")
-    print(f"   QPS: {requests_per_second:.2f}")
-    if response_times:
-        print(f"   平均响应时间: {avg_response_time:.2f}s")
-        print(f"   响应时间范围: {min_response_time:.2f}s - {max_response_time:.2f}s")
-
-    if failed_requests:
-        print(f"   失败原因: {failed_requests[0].get('error', 'Unknown')[:50]}...")
+    success_rate = successful / total_requests * 100 if total_requests > 0 else 0
 
     return {
+        "is_stream": is_stream,
         "concurrency": concurrency,
         "total_requests": total_requests,
         "total_time": total_time,
-        "successful": len(successful_requests),
-        "failed": len(failed_requests),
+        "successful": successful,
+        "failed": failed,
         "success_rate": success_rate,
         "requests_per_second": requests_per_second,
         "avg_response_time": avg_response_time,
         "min_response_time": min_response_time,
         "max_response_time": max_response_time,
-        "results": results
+        "first_error": first_error
     }
 
+def print_concurrency_result(result: Dict):
+    """打印单次并发测试的结果"""
+    print(f"📊 {'流式' if result['is_stream'] else '非流式'}请求结果（混合负载）:")
+    print(f"   成功率: {result['success_rate']:.1f}% ({result['successful']}/{result['total_requests']})")
+    print(f"   QPS: {result['requests_per_second']:.2f}")
+    if result["successful"]:
+        print(f"   平均响应时间: {result['avg_response_time']:.2f}s")
+        print(f"   响应时间范围: {result['min_response_time']:.2f}s - {result['max_response_time']:.2f}s")
+
+    if result["first_error"] is not None:
+        print(f"   失败原因: {result['first_error'][:50]}...")
+
+async def test_concurrent_requests(session: aiohttp.ClientSession):
+    """pytest 入口：10 个并发、共 50 个普通请求应全部成功"""
+    result = await run_concurrency_test(session, concurrency=10, total_requests=50)
+    assert result['successful'] == result['total_requests'], f"普通并发请求失败: {result['first_error']}"
+
+async def test_streaming_concurrency(session: aiohttp.ClientSession):
+    """pytest 入口：5 个并发、共 20 个流式请求应全部成功"""
+    result = await run_concurrency_test(session, concurrency=5, total_requests=20, is_stream=True)
+    assert result['successful'] == result['total_requests'], f"流式并发请求失败: {result['first_error']}"
+
 async def main():
     """主函数"""
     print("=" * 80)
     print("🧪 OpenRouter 代理服务器并发处理能力测试")
     print("=" * 80)
-    print(f"🔗 测试地址: {get_openrouter_proxy_url()}")
+    base_url = get_openrouter_proxy_url()
+    print(f"🔗 测试地址: {base_url}")
+    if _replay_cache is not None:
+        print(f"♻️  回放模式: 命中缓存的请求直接返回缓存结果（{REPLAY_CACHE_PATH}，有效期 {REPLAY_TTL}s）")
     print("=" * 80)
 
-    # 首先检查服务器是否运行
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{get_openrouter_proxy_url()}/health", timeout=5) as response:
+    # 新任务在创建时立即同步执行到第一个 await，省去一次事件循环调度（Python 3.12+）
+    asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+
+    # 健康检查和所有场景共用一个会话，连接池和 keep-alive 连接在场景之间复用；
+    # 各场景的并发数由 worker 数控制，连接池上限为最大场景并发数的两倍（普通请求和流式请求同时执行），
+    # 连接数因此稳定在并发数附近。代理地址为明文 HTTP，不需要 SSL
+    max_concurrency = max(scenario["concurrency"] for scenario in TEST_SCENARIOS)
+    connector = aiohttp.TCPConnector(
+        limit=max_concurrency * 2,
+        limit_per_host=max_concurrency * 2,
+        keepalive_timeout=120,
+        force_close=False,
+        enable_cleanup_closed=True,
+        ssl=False
+    )
+    async with aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=120, connect=10)
+    ) as session:
+        # 首先检查服务器是否运行
+        try:
+            async with session.get(f"{base_url}/health", timeout=HEALTH_CHECK_TIMEOUT) as response:
                 if response.status != 200:
                     print("❌ OpenRouter代理服务器未正常运行")
                     return
-    except Exception as e:
-        print(f"❌ 无法连接到OpenRouter代理服务器: {e}")
-        print("💡 请确保OpenRouter代理服务器正在运行: python openrouter_proxy.py")
-        return
-
-    print("✅ OpenRouter代理服务器运行正常\n")
-
-    # 测试场景
-    test_scenarios = [
-        {"concurrency": 1, "total": 5, "name": "基准测试"},
-        {"concurrency": 5, "total": 20, "name": "轻度并发"},
-        {"concurrency": 10, "total": 50, "name": "中度并发"},
-        {"concurrency": 20, "total": 100, "name": "高度并发"},
-    ]
+        except Exception as e:
+            print(f"❌ 无法连接到OpenRouter代理服务器: {e}")
+            print("💡 请确保OpenRouter代理服务器正在运行: python openrouter_proxy.py")
+            return
+
+        print("✅ OpenRouter代理服务器运行正常\n")
+
+        await run_scenarios(session)
+
+async def run_scenarios(session: aiohttp.ClientSession):
+    """依次运行各并发场景并输出总结"""
 
     all_results = []
 
-    for scenario in test_scenarios:
+    for scenario in TEST_SCENARIOS:
         print(f"\n============================== {scenario['name']} ==============================")
 
-        # 测试普通请求
-        normal_result = await run_concurrency_test(
-            scenario["concurrency"],
-            scenario["total"],
-            is_stream=False
-        )
+        concurrency = scenario["concurrency"]
+        normal_total = scenario["total"]
+        stream_total = min(20, scenario["total"])  # 流式请求减少数量以节省时间
+
+        print(f"🚀 测试并发能力: 非流式 {concurrency} 个并发 {normal_total} 个请求 + 流式 {concurrency} 个并发 {stream_total} 个请求")
+        print("📝 两类请求同时运行，以下结果均为混合负载下的测量值")
 
-        # 测试流式请求
-        stream_result = await run_concurrency_test(
-            scenario["concurrency"],
-            min(20, scenario["total"]),  # 流式请求减少数量以节省时间
-            is_stream=True
+        # 计时前一次性预热两类请求所需的连接，首批请求不再承担建立连接的开销
+        await warm_up_connections(session, concurrency * 2)
+
+        # 输出放在两次计时开始之前，计时区间内不做任何打印
+        print(f"✅ 启动 2 × {concurrency} 个 worker")
+
+        # 普通请求和流式请求互不依赖，共用同一会话同时执行（连接池上限足以容纳两者并发数之和）
+        normal_result, stream_result = await asyncio.gather(
+            run_concurrency_test(session, concurrency, normal_total, is_stream=False),
+            run_concurrency_test(session, concurrency, stream_total, is_stream=True)
         )
 
+        # 两次计时都结束后再输出结果
+        print_concurrency_result(normal_result)
+        print_concurrency_result(stream_result)
+
         all_results.append({
             "name": scenario["name"],
             "normal": normal_result,
@@ -252,11 +390,11 @@ async def main():
 
     # 总结报告
     print("\n" + "=" * 80)
-    print("📋 并发处理能力总结")
+    print("📋 并发处理能力总结（普通与流式请求混合负载）")
     print("=" * 80)
 
     max_qps = 0
-    fastest_response = float('inf')
+    fastest_response = math.inf
 
     for result in all_results:
         normal = result["normal"]
@@ -281,4 +419,23 @@ async def main():
     print("   5. 考虑添加请求限流机制防止过载")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="OpenRouter 代理服务器并发处理能力测试")
+    parser.add_argument(
+        "--replay",
+        action="store_true",
+        help="开发模式：缓存成功的请求结果到磁盘并在重复运行时回放，用于调试测试脚本本身（结果不代表真实性能）"
+    )
+    args = parser.parse_args()
+
+    # 优先使用 uvloop 事件循环（降低大量并发任务的调度开销），不可用时回退到默认循环
+    try:
+        import uvloop
+        loop_factory = uvloop.new_event_loop
+    except ImportError:
+        loop_factory = None
+
+    if args.replay:
+        with shelve.open(REPLAY_CACHE_PATH) as _replay_cache:
+            asyncio.run(main(), loop_factory=loop_factory)
+    else:
+        asyncio.run(main(), loop_factory=loop_factory)
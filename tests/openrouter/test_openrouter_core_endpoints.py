@@ -34,65 +34,36 @@ def get_openrouter_proxy_url():
 def test_health_endpoint():
     """测试健康检查端点"""
     print("🏥 测试 /health 端点...")
-    try:
-        base_url = get_openrouter_proxy_url()
-        response = requests.get(f"{base_url}/health")
-        if response.status_code == 200:
-            data = response.json()
-            print(f"✅ /health 端点正常: {data}")
-            return True
-        else:
-            print(f"❌ /health 端点失败: {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"❌ /health 端点异常: {e}")
-        print(f"💡 请确保OpenRouter代理服务器正在运行: python openrouter_proxy.py")
-        return False
+    base_url = get_openrouter_proxy_url()
+    response = requests.get(f"{base_url}/health")
+    assert response.status_code == 200, f"/health 端点失败: {response.status_code}"
+    data = response.json()
+    assert data.get('status') == 'healthy', f"/health 返回异常状态: {data}"
+    print(f"✅ /health 端点正常: {data}")
 
 def test_models_endpoint():
     """测试 models 端点"""
     print("\n🤖 测试 /v1/models 端点...")
-    try:
-        base_url = get_openrouter_proxy_url()
-        response = requests.get(f"{base_url}/v1/models")
-        if response.status_code == 200:
-            data = response.json()
-            if 'data' in data and isinstance(data['data'], list):
-                print(f"✅ /v1/models 端点正常，返回 {len(data['data'])} 个模型")
-                # 显示前几个模型
-                for i, model in enumerate(data['data'][:3]):
-                    print(f"   - {model.get('id', 'Unknown')}")
-                return True
-            else:
-                print(f"❌ /v1/models 返回格式错误: {data}")
-                return False
-        else:
-            print(f"❌ /v1/models 端点失败: {response.status_code} - {response.text}")
-            return False
-    except Exception as e:
-        print(f"❌ /v1/models 端点异常: {e}")
-        print(f"💡 请确保OpenRouter代理服务器正在运行: python openrouter_proxy.py")
-        return False
+    base_url = get_openrouter_proxy_url()
+    response = requests.get(f"{base_url}/v1/models")
+    assert response.status_code == 200, f"/v1/models 端点失败: {response.status_code} - {response.text}"
+    data = response.json()
+    assert isinstance(data.get('data'), list), f"/v1/models 返回格式错误: {data}"
+    print(f"✅ /v1/models 端点正常，返回 {len(data['data'])} 个模型")
+    # 显示前几个模型
+    for i, model in enumerate(data['data'][:3]):
+        print(f"   - {model.get('id', 'Unknown')}")
 
 def test_service_info():
     """测试服务信息端点"""
     print("\n📋 测试服务信息端点...")
-    try:
-        base_url = get_openrouter_proxy_url()
-        response = requests.get(f"{base_url}/")
-        if response.status_code == 200:
-            data = response.json()
-            print(f"✅ 服务信息正常: {data.get('service', 'Unknown')} - {data.get('status', 'Unknown')}")
-            if 'endpoints' in data:
-                print(f"   可用端点: {list(data['endpoints'].keys())}")
-            return True
-        else:
-            print(f"❌ 服务信息端点失败: {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"❌ 服务信息端点异常: {e}")
-        print(f"💡 请确保OpenRouter代理服务器正在运行: python openrouter_proxy.py")
-        return False
+    base_url = get_openrouter_proxy_url()
+    response = requests.get(f"{base_url}/")
+    assert response.status_code == 200, f"服务信息端点失败: {response.status_code}"
+    data = response.json()
+    assert 'service' in data and 'endpoints' in data, f"服务信息返回格式错误: {data}"
+    print(f"✅ 服务信息正常: {data.get('service', 'Unknown')} - {data.get('status', 'Unknown')}")
+    print(f"   可用端点: {list(data['endpoints'].keys())}")
 
 def main():
     """运行核心功能测试"""
@@ -111,8 +82,11 @@ def main():
     total = len(tests)
 
     for test in tests:
-        if test():
+        try:
+            test()
             passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} 失败: {e}")
         time.sleep(0.5)  # 短暂间隔
 
     print("\n" + "=" * 50)